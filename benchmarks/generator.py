@@ -0,0 +1,77 @@
+import argparse
+import datetime
+import random
+import sqlite3
+from pathlib import Path
+
+from sqlalchemy import create_engine
+
+from database import Model
+
+INSERT_BATCH = 10000
+
+
+def generate_rolls(count: int, removal_ratio: float, start: datetime.date, days: int, length_mean: float,
+                   length_std: float, weight_mean: float, weight_std: float, storage_days: float, seed: int):
+    # длина и вес - нормальное распределение, обрезанное снизу; срок хранения - экспоненциальный
+    rng = random.Random(seed)
+    end = start + datetime.timedelta(days=days - 1)
+    for _ in range(count):
+        added = start + datetime.timedelta(days=rng.randrange(days))
+        removed = None
+        if rng.random() < removal_ratio:
+            removed = added + datetime.timedelta(days=int(rng.expovariate(1 / storage_days)) + 1)
+            if removed > end:
+                removed = None  # к концу периода рулон еще на складе
+        length = round(max(rng.gauss(length_mean, length_std), 1.0), 1)
+        weight = round(max(rng.gauss(weight_mean, weight_std), 0.1), 3)
+        yield length, weight, added.isoformat(), removed.isoformat() if removed is not None else None
+
+
+def fill_database(path: Path, count: int, removal_ratio: float = 0.6, start: datetime.date = datetime.date(2020, 1, 1),
+                  days: int = 3 * 365, length_mean: float = 250, length_std: float = 50, weight_mean: float = 5,
+                  weight_std: float = 1.2, storage_days: float = 30, seed: int = 0) -> None:
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    engine = create_engine(f"sqlite:///{path}")
+    Model.metadata.create_all(engine)
+    engine.dispose()
+
+    rolls = generate_rolls(count, removal_ratio, start, days, length_mean, length_std, weight_mean, weight_std,
+                           storage_days, seed)
+    with sqlite3.connect(path) as conn:
+        batch = []
+        for roll in rolls:
+            batch.append(roll)
+            if len(batch) >= INSERT_BATCH:
+                conn.executemany("insert into rolls (length, weight, added_date, removed_date) values (?, ?, ?, ?)",
+                                 batch)
+                batch = []
+        if batch:
+            conn.executemany("insert into rolls (length, weight, added_date, removed_date) values (?, ?, ?, ?)",
+                             batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение базы синтетическими рулонами")
+    parser.add_argument("--output", default="rolls.db")
+    parser.add_argument("--rolls", type=int, default=100000)
+    parser.add_argument("--removal-ratio", type=float, default=0.6)
+    parser.add_argument("--start", default="01.01.2020", help="дд.мм.гггг")
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--length-mean", type=float, default=250)
+    parser.add_argument("--length-std", type=float, default=50)
+    parser.add_argument("--weight-mean", type=float, default=5)
+    parser.add_argument("--weight-std", type=float, default=1.2)
+    parser.add_argument("--storage-days", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    fill_database(Path(args.output), args.rolls, args.removal_ratio,
+                  datetime.datetime.strptime(args.start, "%d.%m.%Y").date(), args.days, args.length_mean,
+                  args.length_std, args.weight_mean, args.weight_std, args.storage_days, args.seed)
+    print(f"В {args.output} записано рулонов: {args.rolls}; сводка daily_inventory соберется при запуске приложения")
+
+
+if __name__ == "__main__":
+    main()
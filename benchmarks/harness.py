@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+WORKDIR = Path(os.environ.get("ROLLS_BENCH_DIR") or tempfile.mkdtemp(prefix="rolls-bench-"))
+DATABASE_PATH = WORKDIR / "bench.db"
+
+# приложение читает настройки при импорте, поэтому база бенчмарка задается до импорта main; URL из окружения
+# не используется - приложение должно работать с той базой, которую заполнил генератор (каталог - ROLLS_BENCH_DIR)
+os.environ["ROLLS_DATABASE_URL"] = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+sys.path.insert(0, str(ROOT / "operations"))
+sys.path.insert(0, str(ROOT))
+
+import httpx  # noqa: E402
+
+from benchmarks.generator import fill_database  # noqa: E402
+from analytics import analytics_snapshot  # noqa: E402
+from cache import statistic_cache  # noqa: E402
+from database import async_engine  # noqa: E402
+from main import app  # noqa: E402
+from operations.operation_router import STATISTIC_PARAMETERS  # noqa: E402
+
+DATE_FORMAT = "%d.%m.%Y"
+DATA_START = datetime.date(2020, 1, 1)
+DATA_DAYS = 3 * 365
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def random_range(rng: random.Random, span_days: int) -> tuple[str, str]:
+    start = DATA_START + datetime.timedelta(days=rng.randrange(max(DATA_DAYS - span_days, 1)))
+    end = start + datetime.timedelta(days=span_days - 1)
+    return start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)
+
+
+def scenarios(range_days: int):
+    # (эндпоинт, параметр, функция построения запроса)
+    yield "get_rolls", None, lambda rng: ("GET", "/rolls/get_rolls", {"limit": 1000})
+    for parameter in STATISTIC_PARAMETERS:
+        yield "get_statistic", parameter, lambda rng, parameter=parameter: (
+            "GET", "/rolls/get_statistic",
+            dict(zip(("start_date", "end_date"), random_range(rng, range_days)), parameter=parameter))
+    yield "get_all_statistic", None, lambda rng: (
+        "GET", "/rolls/get_all_statistic", dict(zip(("start_date", "end_date"), random_range(rng, range_days))))
+    yield "add_roll", None, lambda rng: (
+        "POST", "/rolls/add_roll",
+        {"length": round(rng.uniform(100, 400), 1), "weight": round(rng.uniform(2, 8), 3),
+         "added_date": (DATA_START + datetime.timedelta(days=rng.randrange(DATA_DAYS))).strftime(DATE_FORMAT)})
+
+
+async def run_scenario(client: httpx.AsyncClient, build, requests: int, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    calls = [build(rng) for _ in range(requests)]
+    latencies, errors = [], 0
+    queue = iter(calls)
+
+    async def worker():
+        nonlocal errors
+        for method, url, params in queue:
+            started = time.perf_counter()
+            response = await client.request(method, url, params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+async def run(sizes: list[int], concurrency_levels: list[int], requests: int, range_days: int,
+              removal_ratio: float, seed: int) -> list[dict]:
+    results = []
+    for size in sizes:
+        await async_engine.dispose()
+        # база генерируется заново, снимок и кэш статистики от предыдущего размера к ней не относятся
+        analytics_snapshot.invalidate_all()
+        statistic_cache.clear()
+        started = time.perf_counter()
+        fill_database(DATABASE_PATH, size, removal_ratio=removal_ratio, start=DATA_START, days=DATA_DAYS, seed=seed)
+        generated = time.perf_counter() - started
+        print(f"{size} рулонов сгенерировано за {generated:.1f} c", file=sys.stderr)
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for concurrency in concurrency_levels:
+                    for endpoint, parameter, build in scenarios(range_days):
+                        result = await run_scenario(client, build, requests, concurrency, seed)
+                        result.update({"dataset_size": size, "concurrency": concurrency, "endpoint": endpoint,
+                                       "parameter": parameter})
+                        results.append(result)
+                        print(f"{size:>9} c={concurrency:<3} {endpoint:<18} {parameter or '':<24} "
+                              f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                              f"p99={result['p99_ms']:.2f}ms {result['throughput_rps']:.1f} rps",
+                              file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон эндпоинтов /rolls на синтетических данных")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="размеры базы через запятую")
+    parser.add_argument("--concurrency", default="1,8", help="уровни конкурентности через запятую")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на сценарий")
+    parser.add_argument("--range-days", type=int, default=90, help="длина диапазона дат для статистики")
+    parser.add_argument("--removal-ratio", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="файл для JSON с результатами, '-' - stdout")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+    # сообщения приложения не должны смешиваться с JSON в stdout
+    with redirect_stdout(sys.stderr):
+        results = asyncio.run(run(sizes, concurrency_levels, args.requests, args.range_days, args.removal_ratio,
+                                  args.seed))
+    report = {
+        "meta": {
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database_url": os.environ["ROLLS_DATABASE_URL"],
+            "requests": args.requests,
+            "range_days": args.range_days,
+            "removal_ratio": args.removal_ratio,
+            "seed": args.seed,
+            "settings": {name: value for name, value in os.environ.items() if name.startswith("ROLLS_")},
+        },
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        Path(args.output).write_text(output, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+from benchmarks.generator import fill_database
+
+ROOT = Path(__file__).resolve().parent.parent
+DATE_FORMAT = "%d.%m.%Y"
+DATA_START = datetime.date(2020, 1, 1)
+DATA_DAYS = 3 * 365
+
+
+def random_request(rng: random.Random, range_days: int, write_ratio: float) -> tuple[str, str, dict]:
+    # смесь запросов дашборда: статистика за случайный период, страница рулонов, поиск и добавление рулона
+    if rng.random() < write_ratio:
+        return "POST", "/rolls/add_roll", {
+            "length": round(rng.uniform(100, 400), 1), "weight": round(rng.uniform(2, 8), 3),
+            "added_date": (DATA_START + datetime.timedelta(days=rng.randrange(DATA_DAYS))).strftime(DATE_FORMAT)}
+    start = DATA_START + datetime.timedelta(days=rng.randrange(DATA_DAYS - range_days))
+    dates = {"start_date": start.strftime(DATE_FORMAT),
+             "end_date": (start + datetime.timedelta(days=range_days - 1)).strftime(DATE_FORMAT)}
+    kind = rng.randrange(3)
+    if kind == 0:
+        return "GET", "/rolls/get_all_statistic", dates
+    if kind == 1:
+        return "GET", "/rolls/get_rolls", {"limit": 1000, "after_id": rng.randrange(1000)}
+    return "GET", "/rolls/get_statistic", dict(dates, parameter="length_quantiles")
+
+
+@contextmanager
+def server(workers: int, port: int, database: Path, workdir: Path):
+    env = dict(os.environ, ROLLS_WORKERS=str(workers), ROLLS_DATABASE_URL=f"sqlite+aiosqlite:///{database}",
+               ROLLS_STATISTIC_CACHE_SIZE="0", PYTHONPATH=os.pathsep.join([str(ROOT / "operations"), str(ROOT)]))
+    log = open(workdir / f"gunicorn-{workers}.log", "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", str(ROOT / "gunicorn.conf.py"), "--bind", f"127.0.0.1:{port}",
+         "main:app"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+        else:
+            raise RuntimeError(f"gunicorn с {workers} воркерами не запустился, см. {log.name}")
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait(30)
+        log.close()
+
+
+async def load(base_url: str, requests: int, concurrency: int, range_days: int, write_ratio: float,
+               seed: int) -> dict:
+    rng = random.Random(seed)
+    calls = iter([random_request(rng, range_days, write_ratio) for _ in range(requests)])
+    latencies, errors = [], 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for method, url, params in calls:
+            started = time.perf_counter()
+            response = await client.request(method, url, params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 3),
+        "throughput_rps": round(requests / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность в зависимости от числа воркеров gunicorn")
+    parser.add_argument("--workers", default="1,2,4", help="число воркеров через запятую")
+    parser.add_argument("--rolls", type=int, default=100000, help="размер синтетической базы")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--range-days", type=int, default=365, help="длина диапазона дат для статистики")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="доля запросов add_roll")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="файл для JSON с результатами, '-' - stdout")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="rolls-workers-"))
+    results = []
+    for workers in [int(count) for count in args.workers.split(",")]:
+        # каждый прогон начинается с одинаковой базы
+        database = workdir / f"bench-{workers}.db"
+        fill_database(database, args.rolls, start=DATA_START, days=DATA_DAYS, seed=args.seed)
+        with server(workers, args.port, database, workdir) as base_url:
+            result = asyncio.run(load(base_url, args.requests, args.concurrency, args.range_days, args.write_ratio,
+                                      args.seed))
+        result["workers"] = workers
+        if results:
+            result["speedup"] = round(result["throughput_rps"] / results[0]["throughput_rps"], 2)
+        results.append(result)
+        print(f"workers={workers:<3} {result['throughput_rps']:.1f} rps p50={result['p50_ms']:.1f}ms "
+              f"p95={result['p95_ms']:.1f}ms errors={result['errors']}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "rolls": args.rolls,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "range_days": args.range_days,
+            "write_ratio": args.write_ratio,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        Path(args.output).write_text(output, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+from typing import Literal
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+load_dotenv()
+
+
+class Settings(BaseModel):
+    # значения переопределяются переменными окружения ROLLS_<ИМЯ_ПОЛЯ> или файлом .env
+    statistic_cache_size: int = 256
+
+    database_url: str = "sqlite+aiosqlite:///rolls.db"
+    database_pool_size: int = 5  # 0 - без пула, новое соединение на каждую сессию
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30
+    # WAL позволяет читать параллельно с записью, synchronous=NORMAL в режиме WAL не теряет целостность
+    sqlite_journal_mode: Literal["wal", "delete", "truncate", "persist", "memory", "off"] = "wal"
+    sqlite_synchronous: Literal["off", "normal", "full", "extra"] = "normal"
+    sqlite_cache_size: int = -64000  # отрицательное значение - размер в КиБ
+    sqlite_mmap_size: int = 268435456
+    sqlite_busy_timeout: int = 5000  # мс
+
+    write_queue_enabled: bool = False  # групповая фиксация add_roll
+    write_queue_window_ms: float = 5
+    write_queue_max_batch: int = 500
+
+    # rollup - сводка daily_inventory, columnar - снимок таблицы в памяти (NumPy)
+    statistic_backend: Literal["rollup", "columnar"] = "rollup"
+    # статистика сводки в отдельном пуле: off - в цикле событий, thread - пул потоков, process - пул процессов
+    statistic_pool: Literal["off", "thread", "process"] = "off"
+    statistic_pool_size: int = 2
+    statistic_timeout: float = 30  # с, 0 - без ограничения
+
+    # архивация: рулоны, удаленные раньше чем archive_after_days дней назад, переносятся в rolls_archive;
+    # 0 - только командой manage.py archive
+    archive_after_days: int = 0
+    archive_interval: float = 3600  # с
+    archive_batch_size: int = 5000
+
+    feed_queue_size: int = 100  # событий в очереди одного подписчика /rolls/feed
+    feed_heartbeat: float = 15  # с
+
+    # несколько воркеров (gunicorn.conf.py): записи сериализуются блокировкой файла <база>.write-lock,
+    # кэши воркеров сбрасываются по журналу roll_changes, который опрашивается не чаще change_poll_interval
+    workers: int = 1
+    change_poll_interval: float = 0.1  # с
+
+    slow_request_ms: float = 0  # запросы дольше порога пишутся в лог вместе с SQL, 0 - выключено
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        values = {}
+        for name in cls.model_fields:
+            value = os.environ.get(f"ROLLS_{name.upper()}")
+            if value is not None:
+                values[name] = value
+        return cls(**values)
+
+
+settings = Settings.from_env()
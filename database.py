@@ -1,12 +1,94 @@
-from sqlalchemy import Column, Integer, Float, String, CheckConstraint, create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+import asyncio
+import datetime
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
-async_engine = create_async_engine("sqlite+aiosqlite:///rolls.db")
+from sqlalchemy import Column, Integer, Float, Date, String, CheckConstraint, Index, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from config import settings
+from metrics import install_engine_hooks
+
+try:
+    import fcntl
+except ImportError:  # Windows: несколько воркеров не поддерживается
+    fcntl = None
+
+
+def engine_options(url: str) -> dict:
+    database = make_url(url).database
+    if database in (None, "", ":memory:"):
+        return {}
+    if settings.database_pool_size <= 0:
+        return {"poolclass": NullPool}
+    # aiosqlite по умолчанию открывает новое соединение на каждую сессию, пул переиспользует соединения
+    return {"poolclass": AsyncAdaptedQueuePool, "pool_size": settings.database_pool_size,
+            "max_overflow": settings.database_max_overflow, "pool_timeout": settings.database_pool_timeout}
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}")
+    cursor.close()
+
+
+async_engine = create_async_engine(settings.database_url, **engine_options(settings.database_url))
+if async_engine.dialect.name == "sqlite":
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+install_engine_hooks(async_engine.sync_engine)
 async_session = async_sessionmaker(async_engine, expire_on_commit=False)
 
-sync_engine = create_engine("sqlite:///rolls.db")
-sync_session = sessionmaker(sync_engine, expire_on_commit=False)
+HEALTH_CHECK_INTERVAL = 5
+
+_write_lock = asyncio.Lock()
+
+
+def write_lock_path(url: str) -> Optional[str]:
+    database = make_url(url).database
+    if database in (None, "", ":memory:"):
+        return None
+    return f"{database}.write-lock"
+
+
+@asynccontextmanager
+async def writer_lock() -> AsyncIterator[None]:
+    # SQLite допускает одного писателя: в процессе записи идут по очереди, между воркерами - по блокировке файла,
+    # поэтому писатели ждут друг друга без ограничения по времени, а не падают по busy_timeout
+    async with _write_lock:
+        path = write_lock_path(settings.database_url)
+        if fcntl is None or settings.workers <= 1 or path is None:
+            yield
+            return
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        acquire = asyncio.ensure_future(asyncio.to_thread(fcntl.flock, descriptor, fcntl.LOCK_EX))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # блокировка освобождается закрытием файла, когда поток ее все-таки получит
+            acquire.add_done_callback(lambda _: os.close(descriptor))
+            raise
+        try:
+            yield
+        finally:
+            os.close(descriptor)
+
+
+@asynccontextmanager
+async def write_session() -> AsyncIterator[AsyncSession]:
+    async with writer_lock():
+        async with async_session() as session:
+            if async_engine.dialect.name == "sqlite":
+                # блокировка записи берется в начале транзакции, а не при первом изменении после чтения
+                await session.execute(text("BEGIN IMMEDIATE"))
+            yield session
 
 
 class Model(DeclarativeBase):
@@ -19,20 +101,161 @@ class RollOrm(Model):
     id = Column(Integer, primary_key=True, index=True)
     length = Column(Float, nullable=False)
     weight = Column(Float, nullable=False)
-    added_date = Column(String)
-    removed_date = Column(String, nullable=True)
+    added_date = Column(Date, index=True)
+    removed_date = Column(Date, nullable=True, index=True)
 
     __table_args__ = (
         CheckConstraint("CAST(length AS REAL) > 0"),
-        CheckConstraint("CAST(weight AS REAL) > 0")
+        CheckConstraint("CAST(weight AS REAL) > 0"),
+        Index("ix_rolls_added_removed", "added_date", "removed_date"),
+        # поиск рулонов: остаток или диапазон удаления вместе с диапазоном добавления (индекс покрывающий),
+        # диапазоны веса и длины без дат
+        Index("ix_rolls_removed_added_weight_length", "removed_date", "added_date", "weight", "length"),
+        Index("ix_rolls_weight_length", "weight", "length"),
+        Index("ix_rolls_length_weight", "length", "weight"),
+        # id удаленных и архивных рулонов не выдаются повторно
+        {"sqlite_autoincrement": True},
     )
 
 
+class RollArchiveOrm(Model):
+    # рулоны, удаленные со склада до даты архивации и перенесенные из rolls с тем же id
+    __tablename__ = "rolls_archive"
+
+    id = Column(Integer, primary_key=True)
+    length = Column(Float, nullable=False)
+    weight = Column(Float, nullable=False)
+    added_date = Column(Date, nullable=False, index=True)
+    removed_date = Column(Date, nullable=False, index=True)
+
+
+class DailyInventoryOrm(Model):
+    # сводка по дням: добавленные в этот день рулоны, удаленные в этот день рулоны и остаток на конец дня
+    __tablename__ = "daily_inventory"
+
+    day = Column(Date, primary_key=True)
+    added_count = Column(Integer, nullable=False, default=0)
+    added_removed_count = Column(Integer, nullable=False, default=0)
+    sum_length = Column(Float, nullable=False, default=0)
+    sum_weight = Column(Float, nullable=False, default=0)
+    min_length = Column(Float, nullable=True)
+    max_length = Column(Float, nullable=True)
+    min_weight = Column(Float, nullable=True)
+    max_weight = Column(Float, nullable=True)
+    min_duration = Column(Integer, nullable=True)
+    max_duration = Column(Integer, nullable=True)
+    removed_count = Column(Integer, nullable=False, default=0)
+    removed_weight = Column(Float, nullable=False, default=0)
+    on_hand_count = Column(Integer, nullable=False, default=0)
+    on_hand_weight = Column(Float, nullable=False, default=0)
+
+
+class RollChangeOrm(Model):
+    # журнал транзакций записи для согласования кэшей воркеров: version растет с каждой записью,
+    # roll_ids - измененные или удаленные рулоны через запятую, "*" - база очищена
+    __tablename__ = "roll_changes"
+
+    version = Column(Integer, primary_key=True)
+    worker = Column(String, nullable=False)
+    roll_ids = Column(String, nullable=False, default="")
+
+
+class DatabaseHealth:
+    # результат последней проверки базы; маршруты читают его вместо запроса к базе на каждый вызов
+    available: bool = False
+    checked_at: Optional[datetime.datetime] = None
+    error: Optional[str] = None
+
+    @classmethod
+    async def check(cls) -> bool:
+        try:
+            async with async_engine.connect() as conn:
+                await conn.execute(text('select 1 from rolls limit 1'))
+        except Exception as e:
+            cls.available, cls.error = False, str(e)
+        else:
+            cls.available, cls.error = True, None
+        cls.checked_at = datetime.datetime.now(datetime.timezone.utc)
+        return cls.available
+
+    @classmethod
+    async def monitor(cls, interval: float = HEALTH_CHECK_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            await cls.check()
+
+
 async def create_tables():
     async with async_engine.begin() as conn:
         await conn.run_sync(Model.metadata.create_all)
+    if async_engine.dialect.name == "sqlite":
+        async with async_engine.connect() as conn:
+            await conn.execute(text("BEGIN IMMEDIATE"))
+            await conn.run_sync(_migrate_autoincrement)
+            await conn.commit()
+    # база, созданная до перехода на тип Date, еще хранит даты как дд.мм.гггг и не читается через RollOrm
+    async with async_engine.connect() as conn:
+        legacy = (await conn.execute(text(
+            "select 1 from rolls where added_date like '__.__.____' or removed_date like '__.__.____' limit 1"
+        ))).scalar()
+    if legacy:
+        print("В rolls найдены даты в формате дд.мм.гггг, выполняется migrate-dates")
+        print(f"Обновлено дат: {await migrate_dates()}")
+    async with async_engine.begin() as conn:
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in RollOrm.__table__.indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+
+
+def _migrate_autoincrement(conn) -> None:
+    # таблица rolls без AUTOINCREMENT выдает новому рулону id удаленного рулона с наибольшим id, который может
+    # уже быть в rolls_archive; такая таблица один раз пересоздается с AUTOINCREMENT
+    sql = conn.execute(text("select sql from sqlite_master where type = 'table' and name = 'rolls'")).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    for index in RollOrm.__table__.indexes:
+        conn.execute(text(f"drop index if exists {index.name}"))
+    conn.execute(text("alter table rolls rename to rolls_old"))
+    RollOrm.__table__.create(conn)
+    columns = ", ".join(column.name for column in RollOrm.__table__.columns)
+    conn.execute(text(f"insert into rolls ({columns}) select {columns} from rolls_old"))
+    conn.execute(text("drop table rolls_old"))
+    archived = conn.execute(text("select coalesce(max(id), 0) from rolls_archive")).scalar()
+    updated = conn.execute(text("update sqlite_sequence set seq = max(seq, :archived) where name = 'rolls'"),
+                           {"archived": archived}).rowcount
+    if not updated:
+        conn.execute(text("insert into sqlite_sequence (name, seq) values ('rolls', :archived)"),
+                     {"archived": archived})
 
 
 async def delete_tables():
+    # журнал изменений не удаляется, иначе номера версий начнутся заново и воркеры пропустят изменения
+    tables = [table for table in Model.metadata.sorted_tables if table.name != RollChangeOrm.__tablename__]
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Model.metadata.drop_all, tables=tables)
+
+
+def _iso_date(column: str) -> str:
+    return f"substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2)"
+
+
+async def migrate_dates(batch_size: int = 10000) -> int:
+    # переводит даты дд.мм.гггг в формат гггг-мм-дд, в котором их хранит тип Date,
+    # пачками по диапазону id, чтобы не держать таблицу в памяти и не блокировать базу надолго
+    async with async_engine.connect() as conn:
+        min_id, max_id = (await conn.execute(text("select min(id), max(id) from rolls"))).one()
+    migrated = 0
+    if min_id is not None:
+        for low in range(min_id, max_id + 1, batch_size):
+            async with async_engine.begin() as conn:
+                for column in ("added_date", "removed_date"):
+                    result = await conn.execute(
+                        text(f"update rolls set {column} = {_iso_date(column)} "
+                             f"where id between :low and :high and {column} like '__.__.____'"),
+                        {"low": low, "high": low + batch_size - 1}
+                    )
+                    migrated += result.rowcount
     async with async_engine.begin() as conn:
-        await conn.run_sync(Model.metadata.drop_all)
+        for index in RollOrm.__table__.indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+    return migrated
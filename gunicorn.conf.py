@@ -0,0 +1,34 @@
+# несколько воркеров uvicorn под gunicorn: gunicorn -c gunicorn.conf.py main:app
+# число воркеров берется из ROLLS_WORKERS или ключа -w; on_starting передает его в settings до запуска воркеров
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "operations"))
+
+from config import settings  # noqa: E402
+
+bind = "0.0.0.0:80"  # переопределяется ключом --bind
+workers = settings.workers
+worker_class = "uvicorn.workers.UvicornWorker"
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # число воркеров могло быть задано ключом -w, а блокировка записи и журнал roll_changes включаются по settings;
+    # воркеры создаются fork мастер-процесса и получают исправленное значение
+    settings.workers = server.cfg.workers
+    os.environ["ROLLS_WORKERS"] = str(server.cfg.workers)
+
+    # таблицы, индексы и сводка готовятся один раз в мастер-процессе, до запуска воркеров
+    from database import create_tables, async_engine
+    from rollup import DailyRollup
+
+    async def prepare():
+        try:
+            await create_tables()
+            await DailyRollup.ensure()
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(prepare())
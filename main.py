@@ -1,20 +1,51 @@
+import asyncio
+
 from fastapi import FastAPI
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
-from database import create_tables, delete_tables
+from config import settings
+from database import create_tables, delete_tables, async_engine, DatabaseHealth
+from metrics import metrics_middleware
 from operations.operation_router import router as roll_router
 from pages.page_router import router as pages_router
+from service.service_router import router as service_router
+from archive import RollArchive
+from coherence import ChangeLog
+from offload import StatisticPool
+from rollup import DailyRollup
+from write_queue import roll_write_queue
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await create_tables()
-    print("База готова к работе")
+    if await DatabaseHealth.check():
+        if await DailyRollup.ensure():
+            print("Сводка daily_inventory пересобрана")
+        print("База готова к работе")
+    else:
+        print(f"База недоступна: {DatabaseHealth.error}")
+    health_monitor = asyncio.create_task(DatabaseHealth.monitor())
+    archiver = asyncio.create_task(RollArchive.monitor()) if settings.archive_after_days > 0 else None
+    change_monitor = asyncio.create_task(ChangeLog.monitor()) if ChangeLog.enabled() else None
+    if settings.write_queue_enabled:
+        roll_write_queue.start()
+    if StatisticPool.start():
+        print(f"Статистика считается в пуле ({settings.statistic_pool}, {settings.statistic_pool_size})")
     yield
+    StatisticPool.stop()
+    await roll_write_queue.stop()
+    for task in (health_monitor, archiver, change_monitor):
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    await async_engine.dispose()
     print("Выключение")
 
 
 app = FastAPI(lifespan=lifespan)
+app.middleware("http")(metrics_middleware)
 app.include_router(roll_router)
 app.include_router(pages_router)
-
+app.include_router(service_router)
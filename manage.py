@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+
+from database import async_engine, create_tables, migrate_dates
+
+
+def run(command, prepare: bool = True):
+    # каждая команда работает со своим циклом событий: таблицы создаются до команды, пул соединений
+    # закрывается после нее, иначе процесс не завершается
+    async def wrapper():
+        try:
+            if prepare:
+                await create_tables()
+            return await command
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(wrapper())
+
+
+async def check_rollup(start_date: str, end_date: str) -> bool:
+    from aggregates import RollAggregates
+    from rollup import DailyRollup
+    from timeline import InventoryTimeline
+
+    ok = True
+    rollup_statistic = await DailyRollup.collect(start_date, end_date)
+    raw_statistic = await RollAggregates.collect(start_date, end_date)
+    for field, value in rollup_statistic:
+        raw_value = getattr(raw_statistic, field)
+        if abs(value - raw_value) > 1e-6 * max(1.0, abs(raw_value)):
+            print(f"{field}: в сводке {value}, по рулонам {raw_value}")
+            ok = False
+    rollup_timeline = await DailyRollup.timeline(start_date, end_date)
+    raw_timeline = await InventoryTimeline.build(start_date, end_date)
+    for (day, count, weight), (_, raw_count, raw_weight) in zip(rollup_timeline.items(), raw_timeline.items()):
+        if count != raw_count or abs(weight - raw_weight) > 1e-6 * max(1.0, abs(raw_weight)):
+            print(f"остаток на {day}: в сводке {count} шт. {weight}, по рулонам {raw_count} шт. {raw_weight}")
+            ok = False
+    return ok
+
+
+SEARCH_EXAMPLES = {
+    "остаток по весу и длине, добавлены за месяц": dict(on_hand=True, min_weight=4, max_weight=6, min_length=200,
+                                                      max_length=300, added_from="01.01.2024", added_to="31.01.2024"),
+    "остаток": dict(on_hand=True),
+    "диапазон веса": dict(min_weight=4, max_weight=6),
+    "диапазон длины": dict(min_length=200, max_length=300),
+    "добавлены за период": dict(added_from="01.01.2024", added_to="31.01.2024"),
+    "удалены за период": dict(removed_from="01.01.2024", removed_to="31.01.2024", min_weight=4),
+    "список id": dict(ids=[1, 2, 3]),
+    "следующая страница": dict(on_hand=True, min_weight=4, after_id=1000),
+}
+
+
+async def check_indexes() -> bool:
+    # каждый пример поиска должен искать по индексу (SEARCH), а не перебирать таблицу rolls (SCAN)
+    from sqlalchemy import text
+    from sqlalchemy.dialects import sqlite
+    from factory import RollFactory
+    from schemas import RollSearch
+
+    ok = True
+    async with async_engine.connect() as conn:
+        for name, filters in SEARCH_EXAMPLES.items():
+            query = RollFactory.search_query(RollSearch(**filters))
+            sql = str(query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+            plan = [row.detail for row in await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            scans = [detail for detail in plan if detail.startswith("SCAN rolls")]
+            print(f"{'ПОЛНЫЙ ПРОСМОТР' if scans else 'индекс'}: {name}: {'; '.join(plan)}")
+            ok = ok and not scans
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды учета рулонов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate-dates", help="перевести даты в rolls.db в формат DATE и создать индексы")
+    migrate.add_argument("--batch-size", type=int, default=10000)
+
+    commands.add_parser("rebuild-rollup", help="пересобрать сводку daily_inventory по таблице rolls")
+
+    check = commands.add_parser("check-rollup", help="сравнить сводку daily_inventory с расчетом по rolls")
+    check.add_argument("start_date", help="дд.мм.гггг")
+    check.add_argument("end_date", help="дд.мм.гггг")
+
+    commands.add_parser("check-indexes", help="проверить по EXPLAIN QUERY PLAN, что поиск рулонов идет по индексам")
+
+    archive = commands.add_parser("archive", help="перенести удаленные рулоны в rolls_archive")
+    cutoff = archive.add_mutually_exclusive_group(required=True)
+    cutoff.add_argument("--before", help="удаленные раньше этой даты, дд.мм.гггг")
+    cutoff.add_argument("--older-than-days", type=int, help="удаленные раньше чем столько дней назад")
+    archive.add_argument("--batch-size", type=int, default=5000)
+
+    args = parser.parse_args()
+    if args.command == "migrate-dates":
+        migrated = run(migrate_dates(args.batch_size), prepare=False)
+        print(f"Обновлено дат: {migrated}")
+    elif args.command == "rebuild-rollup":
+        from rollup import DailyRollup
+        days = run(DailyRollup.rebuild())
+        print(f"Сводка пересобрана, дней: {days}")
+    elif args.command == "check-indexes":
+        if not run(check_indexes()):
+            raise SystemExit(1)
+    elif args.command == "archive":
+        from archive import RollArchive
+        from schemas import parse_date
+        before = parse_date(args.before) if args.before else RollArchive.cutoff(args.older_than_days)
+        moved = run(RollArchive.move(before, args.batch_size))
+        print(f"Перенесено в архив: {moved}")
+    elif args.command == "check-rollup":
+        if run(check_rollup(args.start_date, args.end_date)):
+            print("Сводка совпадает с таблицей rolls")
+        else:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
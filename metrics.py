@@ -0,0 +1,164 @@
+import contextvars
+import logging
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from sqlalchemy import event
+
+from config import settings
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000, 10000, 100000, 1000000)
+
+slow_log = logging.getLogger("rolls.slow_requests")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = ['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name, self.documentation, self.label_names = name, documentation, labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.documentation, self.label_names = name, documentation, labels
+        self.buckets = buckets
+        self.values: dict[tuple, list] = {}  # labels -> [счетчики по корзинам, сумма, количество]
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _labels(self.label_names, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+http_requests = Counter("rolls_http_requests_total", "HTTP requests by route, method and status",
+                        ("route", "method", "status"))
+http_duration = Histogram("rolls_http_request_duration_seconds", "HTTP request latency", ("route", "method"))
+request_queries = Histogram("rolls_http_request_sql_queries", "SQL statements executed per HTTP request",
+                            ("route",), COUNT_BUCKETS)
+request_sql_duration = Histogram("rolls_http_request_sql_duration_seconds", "Time spent in SQL per HTTP request",
+                                 ("route",))
+request_rows = Histogram("rolls_http_request_sql_rows", "Rows fetched or affected by SQL per HTTP request",
+                         ("route",), COUNT_BUCKETS)
+sql_duration = Histogram("rolls_sql_statement_duration_seconds", "SQL statement latency by statement kind",
+                         ("kind",))
+sql_rows = Counter("rolls_sql_rows_total", "Rows fetched or affected by SQL statements", ("kind",))
+
+REGISTRY = [http_requests, http_duration, request_queries, request_sql_duration, request_rows, sql_duration,
+            sql_rows]
+
+
+class RequestStats:
+    def __init__(self, keep_queries: bool):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.statements: Optional[list[tuple[str, float, int]]] = [] if keep_queries else None
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request",
+                                                                                        default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # время начала хранится в контексте выполнения: при ошибке запроса after_cursor_execute не вызывается,
+    # и значение уходит вместе с контекстом, а не копится на соединении из пула
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    # адаптер aiosqlite выбирает все строки при execute; для изменяющих запросов берется rowcount
+    buffered = getattr(cursor, "_rows", None)
+    rows = len(buffered) if buffered else max(cursor.rowcount, 0)
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    sql_duration.observe(elapsed, kind)
+    sql_rows.inc(kind, amount=rows)
+
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        stats.rows += rows
+        if stats.statements is not None:
+            stats.statements.append((statement, elapsed, rows))
+
+
+def install_engine_hooks(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+async def metrics_middleware(request, call_next):
+    stats = RequestStats(keep_queries=settings.slow_request_ms > 0)
+    token = current_request.set(stats)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        current_request.reset(token)
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        http_requests.inc(path, request.method, status)
+        http_duration.observe(elapsed, path, request.method)
+        request_queries.observe(stats.queries, path)
+        request_sql_duration.observe(stats.sql_seconds, path)
+        request_rows.observe(stats.rows, path)
+        if settings.slow_request_ms > 0 and elapsed * 1000 >= settings.slow_request_ms:
+            queries = "".join(f"\n  {duration * 1000:.2f} ms, {rows} rows: {' '.join(statement.split())}"
+                              for statement, duration, rows in stats.statements)
+            slow_log.warning("%s %s %s: %.2f ms, %d SQL statements (%.2f ms)%s", request.method, path, status,
+                             elapsed * 1000, stats.queries, stats.sql_seconds * 1000, queries)
+
+
+def render(extra: Optional[list[str]] = None) -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra or [])
+    return "\n".join(lines) + "\n"
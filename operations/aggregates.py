@@ -0,0 +1,85 @@
+from sqlalchemy import select, func, cast, Integer, union_all
+
+from database import async_session, RollOrm, RollArchiveOrm
+from schemas import RollStatistic, parse_date
+
+
+def date_ordinal(column):
+    # номер дня в формате datetime.date.toordinal()
+    return cast(func.julianday(column) - 1721424.5, Integer)
+
+
+def all_rolls():
+    # рулоны склада вместе с архивом: статистика за прошлые периоды не меняется после архивации
+    def columns(table):
+        return select(table.id, table.length, table.weight, table.added_date, table.removed_date)
+    return union_all(columns(RollOrm), columns(RollArchiveOrm)).subquery("all_rolls")
+
+
+class RollAggregates:
+
+    @classmethod
+    def query(cls, start_date: str, end_date: str):
+        rolls = all_rolls()
+        on_hand = rolls.c.removed_date.is_(None)
+        removed = rolls.c.removed_date.isnot(None)
+        duration = date_ordinal(rolls.c.removed_date) - date_ordinal(rolls.c.added_date)
+        return select(
+            func.count().filter(on_hand).label("count_added"),
+            func.count().filter(removed).label("count_removed"),
+            func.coalesce(func.avg(rolls.c.length), 0).label("mean_length"),
+            func.coalesce(func.avg(rolls.c.weight), 0).label("mean_weight"),
+            func.coalesce(func.min(rolls.c.length), 0).label("min_length"),
+            func.coalesce(func.max(rolls.c.length), 0).label("max_length"),
+            func.coalesce(func.min(rolls.c.weight), 0).label("min_weight"),
+            func.coalesce(func.max(rolls.c.weight), 0).label("max_weight"),
+            func.coalesce(func.sum(rolls.c.length), 0).label("sum_length"),
+            func.coalesce(func.sum(rolls.c.weight), 0).label("sum_weight"),
+            func.coalesce(func.min(duration).filter(removed), 0).label("min_duration_days"),
+            func.coalesce(func.max(duration).filter(removed), 0).label("max_duration_days"),
+        ).filter(
+            rolls.c.added_date.between(parse_date(start_date), parse_date(end_date))
+        )
+
+    @classmethod
+    def daily_query(cls, days=None):
+        # показатели рулонов, сгруппированные по дню добавления
+        rolls = all_rolls()
+        removed = rolls.c.removed_date.isnot(None)
+        duration = date_ordinal(rolls.c.removed_date) - date_ordinal(rolls.c.added_date)
+        query = select(
+            rolls.c.added_date.label("day"),
+            func.count().label("added_count"),
+            func.count(rolls.c.removed_date).label("added_removed_count"),
+            func.sum(rolls.c.length).label("sum_length"),
+            func.sum(rolls.c.weight).label("sum_weight"),
+            func.min(rolls.c.length).label("min_length"),
+            func.max(rolls.c.length).label("max_length"),
+            func.min(rolls.c.weight).label("min_weight"),
+            func.max(rolls.c.weight).label("max_weight"),
+            func.min(duration).filter(removed).label("min_duration"),
+            func.max(duration).filter(removed).label("max_duration"),
+        ).group_by(rolls.c.added_date)
+        if days is not None:
+            query = query.filter(rolls.c.added_date.in_(days))
+        return query
+
+    @classmethod
+    def daily_removed_query(cls, days=None):
+        # рулоны, сгруппированные по дню удаления
+        rolls = all_rolls()
+        query = select(
+            rolls.c.removed_date.label("day"),
+            func.count().label("removed_count"),
+            func.sum(rolls.c.weight).label("removed_weight"),
+        ).filter(rolls.c.removed_date.isnot(None)).group_by(rolls.c.removed_date)
+        if days is not None:
+            query = query.filter(rolls.c.removed_date.in_(days))
+        return query
+
+    @classmethod
+    async def collect(cls, start_date: str, end_date: str) -> RollStatistic:
+        async with async_session() as session:
+            result = await session.execute(cls.query(start_date, end_date))
+            row = result.mappings().one()
+        return RollStatistic(**row)
@@ -0,0 +1,185 @@
+import asyncio
+import datetime
+from array import array
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from aggregates import date_ordinal, all_rolls
+from cache import statistic_cache
+from database import async_session
+from schemas import RollStatistic, parse_date
+from timeline import InventoryTimeline
+
+NOT_REMOVED = np.iinfo(np.int32).max
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+HISTOGRAM_BINS = 10
+ID_CHUNK = 500
+COLUMNS = ("length", "weight", "duration")
+
+
+class ColumnarSnapshot:
+    # копия таблицы rolls в массивах NumPy (id, длина, вес, дни добавления и удаления как ordinal).
+    # Загружается целиком один раз, затем догружает новые id и перечитывает id, измененные после загрузки.
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.length = np.empty(0, dtype=np.float64)
+        self.weight = np.empty(0, dtype=np.float64)
+        self.added = np.empty(0, dtype=np.int32)
+        self.removed = np.empty(0, dtype=np.int32)
+        self.version: Optional[int] = None
+        self.changed_ids: set[int] = set()
+        self.reset = True
+        self.lock = asyncio.Lock()
+        self.loaded_at: Optional[datetime.datetime] = None
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def invalidate_ids(self, ids: Iterable[int]) -> None:
+        self.changed_ids.update(ids)
+
+    def invalidate_all(self) -> None:
+        self.reset = True
+
+    @classmethod
+    def _query(cls, ids: Optional[list[int]] = None, after_id: Optional[int] = None):
+        rolls = all_rolls()
+        query = select(rolls.c.id, rolls.c.length, rolls.c.weight, date_ordinal(rolls.c.added_date),
+                       date_ordinal(rolls.c.removed_date)).order_by(rolls.c.id)
+        if ids is not None:
+            query = query.filter(rolls.c.id.in_(ids))
+        if after_id is not None:
+            query = query.filter(rolls.c.id > after_id)
+        return query
+
+    @classmethod
+    async def _fetch(cls, session, query) -> tuple[np.ndarray, ...]:
+        ids, length, weight, added, removed = array("q"), array("d"), array("d"), array("i"), array("i")
+        result = await session.stream(query)
+        async for partition in result.partitions(10000):
+            for roll_id, roll_length, roll_weight, roll_added, roll_removed in partition:
+                ids.append(roll_id)
+                length.append(roll_length)
+                weight.append(roll_weight)
+                added.append(roll_added)
+                removed.append(NOT_REMOVED if roll_removed is None else roll_removed)
+        return (np.frombuffer(ids, dtype=np.int64), np.frombuffer(length, dtype=np.float64),
+                np.frombuffer(weight, dtype=np.float64), np.frombuffer(added, dtype=np.int32),
+                np.frombuffer(removed, dtype=np.int32))
+
+    async def refresh(self) -> None:
+        async with self.lock:
+            version = statistic_cache.version
+            if version == self.version and not self.reset and not self.changed_ids:
+                return
+            reset, changed = self.reset, self.changed_ids
+            self.reset, self.changed_ids = False, set()
+            try:
+                async with async_session() as session:
+                    if reset:
+                        await self._load_all(session)
+                    else:
+                        await self._load_changes(session, changed)
+            except Exception:
+                self.reset = self.reset or reset
+                self.changed_ids |= changed
+                raise
+            self.version = version
+            self.loaded_at = datetime.datetime.now(datetime.timezone.utc)
+
+    async def _load_all(self, session) -> None:
+        self.ids, self.length, self.weight, self.added, self.removed = await self._fetch(session, self._query())
+        self.full_loads += 1
+
+    async def _load_changes(self, session, changed: set[int]) -> None:
+        max_id = int(self.ids[-1]) if len(self.ids) else 0
+        changed = sorted(roll_id for roll_id in changed if roll_id <= max_id)
+        columns = (self.ids, self.length, self.weight, self.added, self.removed)
+        if changed:
+            # измененные строки выбрасываются из снимка и перечитываются, удаленные просто не вернутся
+            keep = ~np.isin(self.ids, changed)
+            columns = tuple(column[keep] for column in columns)
+        parts = [columns]
+        for start in range(0, len(changed), ID_CHUNK):
+            parts.append(await self._fetch(session, self._query(ids=changed[start:start + ID_CHUNK])))
+        parts.append(await self._fetch(session, self._query(after_id=max_id)))
+        merged = [np.concatenate(values) for values in zip(*parts)]
+        if changed:
+            order = np.argsort(merged[0], kind="stable")
+            merged = [column[order] for column in merged]
+        self.ids, self.length, self.weight, self.added, self.removed = merged
+        self.incremental_loads += 1
+
+    def _range_mask(self, start_date: str, end_date: str) -> np.ndarray:
+        start, end = parse_date(start_date).toordinal(), parse_date(end_date).toordinal()
+        return (self.added >= start) & (self.added <= end)
+
+    def _values(self, column: str, mask: np.ndarray) -> np.ndarray:
+        if column == "duration":
+            mask = mask & (self.removed != NOT_REMOVED)
+            return (self.removed[mask] - self.added[mask]).astype(np.int64)
+        return getattr(self, column)[mask]
+
+    async def collect(self, start_date: str, end_date: str) -> RollStatistic:
+        await self.refresh()
+        mask = self._range_mask(start_date, end_date)
+        on_hand = self.removed == NOT_REMOVED
+        length, weight = self.length[mask], self.weight[mask]
+        durations = self._values("duration", mask)
+        if not len(length):
+            return RollStatistic()
+        return RollStatistic(
+            count_added=int(np.count_nonzero(mask & on_hand)),
+            count_removed=int(np.count_nonzero(mask & ~on_hand)),
+            mean_length=float(length.mean()), mean_weight=float(weight.mean()),
+            min_length=float(length.min()), max_length=float(length.max()),
+            min_weight=float(weight.min()), max_weight=float(weight.max()),
+            sum_length=float(length.sum()), sum_weight=float(weight.sum()),
+            min_duration_days=int(durations.min()) if len(durations) else 0,
+            max_duration_days=int(durations.max()) if len(durations) else 0,
+        )
+
+    async def timeline(self, start_date: str, end_date: str) -> InventoryTimeline:
+        await self.refresh()
+        start, end = parse_date(start_date), parse_date(end_date)
+        first, last = start.toordinal(), end.toordinal()
+        days = max(last - first + 1, 0)
+        added = self.added <= last
+        removed = self.removed <= last
+        added_index = np.clip(self.added[added].astype(np.int64) - first, 0, None)
+        removed_index = np.clip(self.removed[removed].astype(np.int64) - first, 0, None)
+        counts = (np.bincount(added_index, minlength=days + 1)[:days + 1] -
+                  np.bincount(removed_index, minlength=days + 1)[:days + 1]).cumsum()[:days]
+        weights = (np.bincount(added_index, self.weight[added], minlength=days + 1)[:days + 1] -
+                   np.bincount(removed_index, self.weight[removed], minlength=days + 1)[:days + 1]).cumsum()[:days]
+        return InventoryTimeline(start, counts.tolist(), np.round(weights, 6).tolist())
+
+    async def quantiles(self, column: str, start_date: str, end_date: str) -> dict[str, float]:
+        await self.refresh()
+        values = self._values(column, self._range_mask(start_date, end_date))
+        if not len(values):
+            return {}
+        return {str(q): float(value) for q, value in zip(QUANTILES, np.quantile(values, QUANTILES))}
+
+    async def histogram(self, column: str, start_date: str, end_date: str) -> dict[str, list]:
+        await self.refresh()
+        values = self._values(column, self._range_mask(start_date, end_date))
+        if not len(values):
+            return {"edges": [], "counts": []}
+        counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+        return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+    def footprint(self) -> dict:
+        rolls = len(self.ids)
+        size = sum(column.nbytes for column in (self.ids, self.length, self.weight, self.added, self.removed))
+        per_roll = (self.ids.itemsize + self.length.itemsize + self.weight.itemsize + self.added.itemsize +
+                    self.removed.itemsize)
+        return {"rolls": rolls, "bytes": size, "bytes_per_roll": per_roll,
+                "megabytes_per_million_rolls": round(per_roll * 1_000_000 / 2 ** 20, 2),
+                "version": self.version, "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+                "full_loads": self.full_loads, "incremental_loads": self.incremental_loads}
+
+
+analytics_snapshot = ColumnarSnapshot()
@@ -0,0 +1,62 @@
+import asyncio
+import datetime
+from typing import Optional
+
+from sqlalchemy import select, insert, delete, func
+
+from config import settings
+from database import async_session, write_session, RollOrm, RollArchiveOrm, DatabaseHealth
+
+ARCHIVE_COLUMNS = ("id", "length", "weight", "added_date", "removed_date")
+
+
+class RollArchive:
+    # рулоны, удаленные раньше даты отсечки, переносятся из rolls в rolls_archive пачками, каждая пачка - отдельная
+    # транзакция. Сводка daily_inventory и статистика считаются по rolls вместе с архивом и не меняются.
+    last_run: Optional[datetime.datetime] = None
+    last_moved = 0
+
+    @classmethod
+    async def move(cls, before: datetime.date, batch_size: int = settings.archive_batch_size) -> int:
+        moved = 0
+        while True:
+            async with write_session() as session:
+                result = await session.execute(
+                    select(RollOrm.id).filter(RollOrm.removed_date < before)
+                    .order_by(RollOrm.id).limit(batch_size)
+                )
+                ids = result.scalars().all()
+                if not ids:
+                    break
+                columns = [getattr(RollOrm, column) for column in ARCHIVE_COLUMNS]
+                await session.execute(
+                    insert(RollArchiveOrm).from_select(ARCHIVE_COLUMNS, select(*columns).filter(RollOrm.id.in_(ids)))
+                )
+                await session.execute(delete(RollOrm).filter(RollOrm.id.in_(ids)))
+                await session.commit()
+            moved += len(ids)
+        cls.last_run, cls.last_moved = datetime.datetime.now(datetime.timezone.utc), moved
+        return moved
+
+    @classmethod
+    def cutoff(cls, after_days: int) -> datetime.date:
+        return datetime.date.today() - datetime.timedelta(days=after_days)
+
+    @classmethod
+    async def monitor(cls, interval: float = settings.archive_interval):
+        while True:
+            await asyncio.sleep(interval)
+            if not DatabaseHealth.available:
+                continue
+            try:
+                await cls.move(cls.cutoff(settings.archive_after_days))
+            except Exception as e:
+                print(f"Архивация не выполнена: {e}")
+
+    @classmethod
+    async def stats(cls) -> dict:
+        async with async_session() as session:
+            live = (await session.execute(select(func.count()).select_from(RollOrm))).scalar_one()
+            archived = (await session.execute(select(func.count()).select_from(RollArchiveOrm))).scalar_one()
+        return {"rolls": live, "archived": archived, "last_run": cls.last_run.isoformat() if cls.last_run else None,
+                "last_moved": cls.last_moved}
@@ -0,0 +1,68 @@
+import asyncio
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Hashable
+
+from config import settings
+
+
+class StatisticCache:
+    # результаты статистики хранятся вместе с версией данных; любая запись в базу увеличивает версию,
+    # и старые записи кэша перестают совпадать. Одинаковые одновременные запросы ждут одно вычисление.
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.version = 0
+        self.entries: OrderedDict[Hashable, tuple[int, Any]] = OrderedDict()
+        self.pending: dict[tuple[Hashable, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def bump(self) -> None:
+        self.version += 1
+
+    def clear(self) -> None:
+        # полный сброс вместе со счетчиками, например при замене базы целиком
+        self.bump()
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = self.coalesced = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        version = self.version
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        task = self.pending.get((key, version))
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self.pending[(key, version)] = task
+            task.add_done_callback(partial(self._store, key, version))
+        else:
+            self.coalesced += 1
+        # отмена одного из ожидающих запросов не отменяет общее вычисление
+        return await asyncio.shield(task)
+
+    def _store(self, key: Hashable, version: int, task: asyncio.Future) -> None:
+        self.pending.pop((key, version), None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if version != self.version or self.max_size <= 0:
+            return
+        self.entries[key] = (version, task.result())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "coalesced": self.coalesced,
+                "size": len(self.entries), "max_size": self.max_size, "version": self.version}
+
+
+statistic_cache = StatisticCache(settings.statistic_cache_size)
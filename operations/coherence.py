@@ -0,0 +1,109 @@
+import asyncio
+import time
+import uuid
+from typing import Iterable, Optional
+
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from analytics import analytics_snapshot
+from cache import statistic_cache
+from config import settings
+from database import async_session, RollChangeOrm, DatabaseHealth
+from feed import inventory_feed
+from rollup import DailyRollup
+
+CHANGE_LOG_SIZE = 10000  # сколько последних версий хранится в roll_changes
+RESET = "*"
+
+
+class ChangeLog:
+    # в режиме нескольких воркеров каждая транзакция записи добавляет строку в roll_changes; воркер, увидев чужие
+    # версии, сбрасывает кэш статистики, перечитывает в снимке измененные рулоны и отправляет подписчикам остатки
+    worker = uuid.uuid4().hex
+    seen: Optional[int] = None
+    polled_at = 0.0
+    applied = 0
+    resets = 0
+    lock = asyncio.Lock()
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return settings.workers > 1
+
+    @classmethod
+    async def record(cls, session: AsyncSession, roll_ids: Iterable[int] = (), reset: bool = False) -> None:
+        if not cls.enabled():
+            return
+        roll_ids = RESET if reset else ",".join(str(roll_id) for roll_id in roll_ids)
+        result = await session.execute(
+            insert(RollChangeOrm).values(worker=cls.worker, roll_ids=roll_ids).returning(RollChangeOrm.version)
+        )
+        version = result.scalar_one()
+        if version % 1000 == 0:
+            await session.execute(delete(RollChangeOrm).filter(RollChangeOrm.version <= version - CHANGE_LOG_SIZE))
+
+    @classmethod
+    async def sync(cls, force: bool = False) -> int:
+        # возвращает число примененных чужих изменений
+        if not cls.enabled():
+            return 0
+        now = time.monotonic()
+        if not force and now - cls.polled_at < settings.change_poll_interval:
+            return 0
+        cls.polled_at = now
+        # опрос из monitor() и из запросов не должен идти одновременно: иначе второй опрос видит seen,
+        # уже сдвинутый первым, принимает журнал за обрезанный и применяет те же изменения повторно
+        async with cls.lock:
+            return await cls._sync()
+
+    @classmethod
+    async def _sync(cls) -> int:
+        seen = cls.seen
+        async with async_session() as session:
+            latest = (await session.execute(select(func.max(RollChangeOrm.version)))).scalar() or 0
+            if seen is None or latest == seen:
+                cls.seen = latest
+                return 0
+            result = await session.execute(
+                select(RollChangeOrm.version, RollChangeOrm.worker, RollChangeOrm.roll_ids)
+                .filter(RollChangeOrm.version > seen, RollChangeOrm.version <= latest).order_by(RollChangeOrm.version)
+            )
+            rows = result.all()
+            # журнал обрезан дальше последней прочитанной версии - сбрасывается весь снимок
+            complete = latest > seen and bool(rows) and rows[0].version == seen + 1
+            cls.seen = latest
+            foreign = [row for row in rows if row.worker != cls.worker]
+            if complete and not foreign:
+                return 0
+            statistic_cache.bump()
+            if complete and all(row.roll_ids != RESET for row in foreign):
+                analytics_snapshot.invalidate_ids(
+                    int(roll_id) for row in foreign for roll_id in row.roll_ids.split(",") if roll_id
+                )
+            else:
+                analytics_snapshot.invalidate_all()
+                cls.resets += 1
+            if inventory_feed.subscribers:
+                inventory_feed.publish("changed", await DailyRollup.totals(session), count=len(foreign))
+            else:
+                inventory_feed.on_hand = None
+        cls.applied += len(foreign)
+        return len(foreign)
+
+    @classmethod
+    async def monitor(cls):
+        # фоновый опрос нужен подписчикам /rolls/feed; запросы статистики дополнительно вызывают sync() сами
+        while True:
+            await asyncio.sleep(settings.change_poll_interval)
+            if not DatabaseHealth.available:
+                continue
+            try:
+                await cls.sync(force=True)
+            except Exception as e:
+                print(f"Журнал изменений не прочитан: {e}")
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {"enabled": cls.enabled(), "worker": cls.worker, "seen": cls.seen, "applied": cls.applied,
+                "resets": cls.resets}
@@ -1,212 +1,326 @@
-import datetime
-from typing import Union, Any
+from typing import Optional, AsyncIterator
 
-from sqlalchemy import select, text
+import orjson
+from sqlalchemy import select, insert, update, tuple_
+from sqlalchemy.exc import IntegrityError
 
-from database import async_session, RollOrm, sync_session
-from schemas import RollAdd, Roll, Dict_generator
+from analytics import analytics_snapshot
+from cache import statistic_cache
+from config import settings
+from coherence import ChangeLog
+from database import async_session, write_session, RollOrm, DatabaseHealth
+from feed import inventory_feed
+from offload import StatisticPool, statistic_job, timeline_job
+from rollup import DailyRollup
+from schemas import RollAdd, RollSearch, RollStatistic, parse_date, format_date
+from timeline import InventoryTimeline
+
+SORT_KEYS = {
+    "id": RollOrm.id,
+    "added_date": RollOrm.added_date,
+}
+STREAM_CHUNK_SIZE = 1000
+
+
+def roll_row(row) -> dict:
+    return {"id": row.id, "length": row.length, "weight": row.weight,
+            "added_date": format_date(row.added_date), "removed_date": format_date(row.removed_date)}
 
 
 class RollFactory:
 
     @classmethod
     def check_connection(cls) -> bool:
-        with sync_session() as session:
-            try:
-                answer = session.execute(text('select 1 from rolls')).first()
-            except Exception:
-                return False
-            else:
-                return True
+        # состояние базы проверяется при запуске и периодически в фоне, см. DatabaseHealth
+        return DatabaseHealth.available
 
     @classmethod
     async def add_one_roll(cls, data: RollAdd) -> int:
-        async with async_session() as session:
-            roll_dict = data.model_dump()
-            roll = RollOrm(**roll_dict)
+        async with write_session() as session:
+            roll = RollOrm(**data.orm_values())
             try:
                 session.add(roll)
                 await session.flush()
             except Exception:
                 return -1
             else:
-                await session.flush()
+                await DailyRollup.refresh_days(session, (roll.added_date, roll.removed_date))
+                on_hand = await DailyRollup.totals(session)
+                await ChangeLog.record(session)
                 await session.commit()
+                statistic_cache.bump()
+                inventory_feed.publish("added", on_hand, count=1, rolls=[roll_row(roll)])
                 return roll.id
 
     @classmethod
-    async def find_all(cls, sorting_properties: str) -> list[Roll]:
-        async with async_session() as session:
-            if sorting_properties != '':
-                query = select(RollOrm).order_by(text(sorting_properties))
+    async def add_rolls(cls, rows: list[tuple[int, dict]]) -> tuple[int, list[dict]]:
+        # rows: (номер строки в запросе, значения рулона); пачка вставляется одним executemany,
+        # при нарушении ограничений пачка повторяется построчно, чтобы найти ошибочные строки
+        days = {values["added_date"] for _, values in rows} | {values["removed_date"] for _, values in rows}
+        async with write_session() as session:
+            try:
+                await session.execute(insert(RollOrm), [values for _, values in rows])
+                await DailyRollup.refresh_days(session, days)
+                on_hand = await DailyRollup.totals(session)
+                await ChangeLog.record(session)
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+            else:
+                statistic_cache.bump()
+                inventory_feed.publish("added", on_hand, count=len(rows))
+                return len(rows), []
+
+            inserted, errors = 0, []
+            for row_number, values in rows:
+                try:
+                    await session.execute(insert(RollOrm), [values])
+                except IntegrityError:
+                    errors.append({"row": row_number, "message": "вес и длинна должны быть больше 0"})
+                else:
+                    inserted += 1
+            await DailyRollup.refresh_days(session, days)
+            on_hand = await DailyRollup.totals(session)
+            await ChangeLog.record(session)
+            await session.commit()
+        statistic_cache.bump()
+        inventory_feed.publish("added", on_hand, count=inserted)
+        return inserted, errors
+
+    @classmethod
+    async def add_roll_batch(cls, rolls: list[RollAdd]) -> list[int]:
+        # все рулоны пачки пишутся одной транзакцией; для рулона, нарушившего ограничения, возвращается -1
+        values = [roll.orm_values() for roll in rolls]
+        days = {value["added_date"] for value in values} | {value["removed_date"] for value in values}
+        async with write_session() as session:
+            roll_ids = []
+            for value in values:
+                try:
+                    result = await session.execute(insert(RollOrm).returning(RollOrm.id), [value])
+                except IntegrityError:
+                    roll_ids.append(-1)
+                else:
+                    roll_ids.append(result.scalar_one())
+            await DailyRollup.refresh_days(session, days)
+            on_hand = await DailyRollup.totals(session)
+            await ChangeLog.record(session)
+            await session.commit()
+        statistic_cache.bump()
+        added = [{"id": roll_id, **roll.model_dump()} for roll_id, roll in zip(roll_ids, rolls) if roll_id >= 0]
+        inventory_feed.publish("added", on_hand, count=len(added), rolls=added)
+        return roll_ids
+
+    @classmethod
+    async def remove_rolls(cls, ids: Optional[list[int]], start_id: Optional[int], end_id: Optional[int],
+                           removed_date: str) -> tuple[int, list[int], list[int]]:
+        # отметка об удалении ставится одним UPDATE по списку id или по диапазону id
+        if ids is not None:
+            ids = sorted(set(ids))
+            selected = RollOrm.id.in_(ids)
+        else:
+            selected = RollOrm.id.between(start_id, end_id)
+        async with write_session() as session:
+            result = await session.execute(
+                select(RollOrm.id, RollOrm.added_date, RollOrm.removed_date).filter(selected)
+            )
+            found, already_removed = set(), []
+            days = {parse_date(removed_date)}
+            for roll_id, roll_added_date, roll_removed_date in result:
+                found.add(roll_id)
+                if roll_removed_date is not None:
+                    already_removed.append(roll_id)
+                else:
+                    days.add(roll_added_date)
+            requested = ids if ids is not None else range(start_id, end_id + 1)
+            not_found = [roll_id for roll_id in requested if roll_id not in found]
+
+            result = await session.execute(
+                update(RollOrm).filter(selected, RollOrm.removed_date.is_(None))
+                .values(removed_date=parse_date(removed_date))
+            )
+            removed = found.difference(already_removed)
+            await DailyRollup.refresh_days(session, days)
+            on_hand = await DailyRollup.totals(session)
+            await ChangeLog.record(session, removed)
+            await session.commit()
+        statistic_cache.bump()
+        analytics_snapshot.invalidate_ids(removed)
+        inventory_feed.publish("removed", on_hand, count=len(removed), ids=sorted(removed), removed_date=removed_date)
+        return result.rowcount, not_found, sorted(already_removed)
+
+    @classmethod
+    def page_query(cls, sort_key: str, after_id: Optional[int], limit: int, after_key: Optional[str] = None):
+        column = SORT_KEYS[sort_key]
+        query = select(RollOrm.id, RollOrm.length, RollOrm.weight, RollOrm.added_date, RollOrm.removed_date)
+        if after_id is not None:
+            if column is RollOrm.id:
+                query = query.filter(RollOrm.id > after_id)
             else:
-                query = select(RollOrm)
-            result = await session.execute(query)
-            roll_models = result.scalars().all()
-            roll_schemas = [Roll.model_validate(roll_model) for roll_model in roll_models]
-            return roll_schemas
+                # курсор - пара (значение ключа, id) последней строки страницы, порядок по индексу (ключ, id);
+                # строка курсора могла быть удалена или перенесена в архив, поэтому ключ не перечитывается по id
+                query = query.filter(tuple_(column, RollOrm.id) > tuple_(parse_date(after_key), after_id))
+        if column is RollOrm.id:
+            return query.order_by(RollOrm.id).limit(limit)
+        return query.order_by(column, RollOrm.id).limit(limit)
 
     @classmethod
-    def delete_roll_info(cls, roll_id: str) -> bool:
-        with sync_session() as session:
-            roll = session.get(RollOrm, int(roll_id))
+    async def find_page(cls, sort_key: str, after_id: Optional[int], limit: int,
+                        after_key: Optional[str] = None) -> list[dict]:
+        async with async_session() as session:
+            result = await session.execute(cls.page_query(sort_key, after_id, limit, after_key))
+            return [roll_row(row) for row in result]
+
+    @classmethod
+    async def stream_rolls(cls, sort_key: str, after_id: Optional[int], after_key: Optional[str] = None,
+                           chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        # каждая пачка читается отдельным запросом, в памяти не больше chunk_size строк
+        while True:
+            rolls = await cls.find_page(sort_key, after_id, chunk_size, after_key)
+            if not rolls:
+                break
+            yield b"".join(orjson.dumps(roll) + b"\n" for roll in rolls)
+            if len(rolls) < chunk_size:
+                break
+            after_id, after_key = rolls[-1]["id"], rolls[-1][sort_key]
+
+    @classmethod
+    def search_query(cls, search: RollSearch):
+        conditions = []
+        if search.ids is not None:
+            conditions.append(RollOrm.id.in_(sorted(set(search.ids))))
+        for column, low, high in ((RollOrm.length, search.min_length, search.max_length),
+                                  (RollOrm.weight, search.min_weight, search.max_weight),
+                                  (RollOrm.added_date, search.added_from, search.added_to),
+                                  (RollOrm.removed_date, search.removed_from, search.removed_to)):
+            if isinstance(low, str):
+                low = parse_date(low)
+            if isinstance(high, str):
+                high = parse_date(high)
+            if low is not None:
+                conditions.append(column >= low)
+            if high is not None:
+                conditions.append(column <= high)
+        if search.on_hand:
+            conditions.append(RollOrm.removed_date.is_(None))
+        if search.removed:
+            conditions.append(RollOrm.removed_date.isnot(None))
+        if search.after_id is not None:
+            conditions.append(RollOrm.id > search.after_id)
+        return (select(RollOrm.id, RollOrm.length, RollOrm.weight, RollOrm.added_date, RollOrm.removed_date)
+                .filter(*conditions).order_by(RollOrm.id).limit(search.limit))
+
+    @classmethod
+    async def search_rolls(cls, search: RollSearch) -> list[dict]:
+        async with async_session() as session:
+            result = await session.execute(cls.search_query(search))
+            return [roll_row(row) for row in result]
+
+    @classmethod
+    async def delete_roll_info(cls, roll_id: int) -> bool:
+        async with write_session() as session:
+            roll = await session.get(RollOrm, roll_id)
             if roll is None:
                 return False
             else:
-                session.delete(roll)
-                session.commit()
+                await session.delete(roll)
+                await DailyRollup.refresh_days(session, (roll.added_date, roll.removed_date))
+                on_hand = await DailyRollup.totals(session)
+                await ChangeLog.record(session, (roll.id,))
+                await session.commit()
+                statistic_cache.bump()
+                analytics_snapshot.invalidate_ids((roll.id,))
+                inventory_feed.publish("deleted", on_hand, count=1, ids=[roll.id])
                 return True
 
     @classmethod
-    def delete_roll(cls, roll_id: str, removed_date: str) -> bool:
-        with sync_session() as session:
-            roll = session.get(RollOrm, int(roll_id))
+    async def delete_roll(cls, roll_id: int, removed_date: str) -> bool:
+        async with write_session() as session:
+            roll = await session.get(RollOrm, roll_id)
             if roll is None:
                 return False
             else:
-                roll.removed_date = removed_date
-                session.commit()
+                days = (roll.added_date, roll.removed_date, parse_date(removed_date))
+                roll.removed_date = parse_date(removed_date)
+                await DailyRollup.refresh_days(session, days)
+                on_hand = await DailyRollup.totals(session)
+                await ChangeLog.record(session, (roll.id,))
+                await session.commit()
+                statistic_cache.bump()
+                analytics_snapshot.invalidate_ids((roll.id,))
+                inventory_feed.publish("removed", on_hand, count=1, ids=[roll.id], removed_date=removed_date)
                 return True
 
     @classmethod
-    def get_roll_by_id(cls, roll_id: str) -> dict:
-        with sync_session() as session:
-            roll = session.query(RollOrm).get(roll_id)
+    async def get_roll_by_id(cls, roll_id: int) -> dict:
+        async with async_session() as session:
+            roll = await session.get(RollOrm, roll_id)
             if roll is None:
                 return {"status": False, "roll_id": roll_id, "length": 0, "weight": 0, "added_date": 0,
                         "removed_date": 0}
             else:
                 return {"status": True, "roll_id": roll_id, "length": roll.length, "weight": roll.weight,
-                        "added_date": roll.added_date, "removed_date": roll.removed_date}
+                        "added_date": format_date(roll.added_date), "removed_date": format_date(roll.removed_date)}
 
     @classmethod
-    async def count_added(cls, start_date: str, end_date: str) -> int:
-        async with async_session() as session:
-            query = select(RollOrm).filter(
-                RollOrm.added_date.between(start_date, end_date),
-                RollOrm.removed_date.is_(None)  # RollOrm.removed_date <= end_date
-            )
-            result = await session.execute(query)
-            roll_models = result.scalars().all()
-            roll_schemas = [Roll.model_validate(roll_model) for roll_model in roll_models]
+    async def get_statistic(cls, start_date: str, end_date: str) -> RollStatistic:
+        if settings.statistic_backend == "columnar":
+            return await analytics_snapshot.collect(start_date, end_date)
+        if StatisticPool.enabled():
+            return await StatisticPool.run(statistic_job, start_date, end_date)
+        return await DailyRollup.collect(start_date, end_date)
 
-        length = len(roll_schemas)
-        return length
+    @classmethod
+    async def count_added(cls, start_date: str, end_date: str) -> int:
+        statistic = await cls.get_statistic(start_date, end_date)
+        return statistic.count_added
 
     @classmethod
     async def count_removed(cls, start_date: str, end_date: str) -> int:
-        async with async_session() as session:
-            query = select(RollOrm).filter(
-                RollOrm.added_date.between(start_date, end_date),
-                RollOrm.removed_date.isnot(None)
-            )
-            result = await session.execute(query)
-            roll_models = result.scalars().all()
-            roll_schemas = [Roll.model_validate(roll_model) for roll_model in roll_models]
-
-        length = len(roll_schemas)
-        return length
+        statistic = await cls.get_statistic(start_date, end_date)
+        return statistic.count_removed
 
     @classmethod
-    async def mean_length_weight(cls, start_date: str, end_date: str) -> tuple[Union[float, Any], Union[float, Any]]:
-        async with async_session() as session:
-            query = select(RollOrm).filter(
-                RollOrm.added_date.between(start_date, end_date)
-            )
-            result = await session.execute(query)
-            roll_models = result.scalars().all()
-
-            total_length = sum([roll.length for roll in roll_models])
-            total_weight = sum([roll.weight for roll in roll_models])
-
-            average_length = total_length / len(roll_models) if roll_models else 0
-            average_weight = total_weight / len(roll_models) if roll_models else 0
-
-        return average_length, average_weight
+    async def mean_length_weight(cls, start_date: str, end_date: str) -> tuple[float, float]:
+        statistic = await cls.get_statistic(start_date, end_date)
+        return statistic.mean_length, statistic.mean_weight
 
     @classmethod
-    async def min_max_length_weight(cls, start_date: str, end_date: str) -> tuple[
-        Union[int, Any], Union[int, Any], Union[int, Any], Union[int, Any]]:
-        async with async_session() as session:
-            query = select(RollOrm).filter(
-                RollOrm.added_date.between(start_date, end_date)
-            )
-            result = await session.execute(query)
-            roll_models = result.scalars().all()
-
-            max_length = max([roll.length for roll in roll_models]) if roll_models else 0
-            min_length = min([roll.length for roll in roll_models]) if roll_models else 0
-
-            max_weight = max([roll.weight for roll in roll_models]) if roll_models else 0
-            min_weight = min([roll.weight for roll in roll_models]) if roll_models else 0
-
-        return min_length, max_length, min_weight, max_weight
+    async def min_max_length_weight(cls, start_date: str, end_date: str) -> tuple[float, float, float, float]:
+        statistic = await cls.get_statistic(start_date, end_date)
+        return statistic.min_length, statistic.max_length, statistic.min_weight, statistic.max_weight
 
     @classmethod
-    async def sum_length_weight(cls, start_date: str, end_date: str) -> tuple[Union[int, Any], Union[int, Any]]:
-        async with async_session() as session:
-            query = select(RollOrm).filter(
-                RollOrm.added_date.between(start_date, end_date)
-            )
-            result = await session.execute(query)
-            roll_models = result.scalars().all()
-            total_length = sum([roll.length for roll in roll_models])
-            total_weight = sum([roll.weight for roll in roll_models])
-
-        return total_length, total_weight
+    async def sum_length_weight(cls, start_date: str, end_date: str) -> tuple[float, float]:
+        statistic = await cls.get_statistic(start_date, end_date)
+        return statistic.sum_length, statistic.sum_weight
 
     @classmethod
     async def min_max_datadiff(cls, start_date: str, end_date: str) -> tuple[int, int]:
-        async with async_session() as session:
-            query = select(RollOrm).filter(
-                RollOrm.added_date.between(start_date, end_date),
-                RollOrm.removed_date.isnot(None)
-            )
-            result = await session.execute(query)
-            roll_models = result.scalars().all()
-
-            durations = [(datetime.datetime.strptime(roll.removed_date, "%d.%m.%Y") -
-                          datetime.datetime.strptime(roll.added_date, "%d.%m.%Y")).days for roll in roll_models]
-
-            max_duration_days = max(durations, default=0) if durations else 0
-            min_duration_days = min(durations, default=0) if durations else 0
-
-        return min_duration_days, max_duration_days
+        statistic = await cls.get_statistic(start_date, end_date)
+        return statistic.min_duration_days, statistic.max_duration_days
 
     @classmethod
-    async def min_max_inventory_days(cls, start_date: str, end_date: str) -> tuple[Any, Any]:
-        date_format = '%d.%m.%Y'
-        step = datetime.timedelta(days=1)
-        start_date = datetime.datetime.strptime(start_date, date_format)
-        end_date = datetime.datetime.strptime(end_date, date_format)
-        dictionary = Dict_generator()
-        while start_date <= end_date:
-            dictionary.add_el(await cls.count_added(start_date.strftime(date_format), start_date.strftime(date_format)),
-                              start_date.strftime(date_format))
-
-            start_date += step
-
-        dictionary = dictionary.dictionary
-        dictionary = dict(sorted(dictionary.items(), key=lambda item: item[0]))
-
-        min_date, max_date = list(dictionary.items())[0][1], list(dictionary.items())[-1][1]
-        return min_date, max_date
+    async def inventory_timeline(cls, start_date: str, end_date: str) -> InventoryTimeline:
+        if settings.statistic_backend == "columnar":
+            return await analytics_snapshot.timeline(start_date, end_date)
+        if StatisticPool.enabled():
+            return await StatisticPool.run(timeline_job, start_date, end_date)
+        return await DailyRollup.timeline(start_date, end_date)
 
     @classmethod
-    async def min_max_wight_days(cls, start_date: str, end_date: str) -> tuple[str, str]:
-        date_format = '%d.%m.%Y'
-        step = datetime.timedelta(days=1)
-        start_date = datetime.datetime.strptime(start_date, date_format)
-        end_date = datetime.datetime.strptime(end_date, date_format)
-        dictionary = Dict_generator()
-        while start_date <= end_date:
-            _, weight = await cls.sum_length_weight(start_date.strftime(date_format), start_date.strftime(date_format))
-            dictionary.add_el(weight, start_date.strftime(date_format))
+    async def min_max_inventory_days(cls, start_date: str, end_date: str) -> tuple[Optional[str], Optional[str]]:
+        timeline = await cls.inventory_timeline(start_date, end_date)
+        return timeline.min_max_count_days()
 
-            start_date += step
+    @classmethod
+    async def min_max_wight_days(cls, start_date: str, end_date: str) -> tuple[Optional[str], Optional[str]]:
+        timeline = await cls.inventory_timeline(start_date, end_date)
+        return timeline.min_max_weight_days()
 
-        dictionary = dictionary.dictionary
-        dictionary = dict(sorted(dictionary.items(), key=lambda item: item[0]))
+    @classmethod
+    async def quantiles(cls, column: str, start_date: str, end_date: str) -> dict[str, float]:
+        return await analytics_snapshot.quantiles(column, start_date, end_date)
 
-        min_date, max_date = list(dictionary.items())[0][1], list(dictionary.items())[-1][1]
-        return min_date, max_date
+    @classmethod
+    async def histogram(cls, column: str, start_date: str, end_date: str) -> dict[str, list]:
+        return await analytics_snapshot.histogram(column, start_date, end_date)
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Optional
+
+import orjson
+
+from config import settings
+from database import async_session
+from rollup import DailyRollup
+
+
+class FeedSubscriber:
+    # очередь подписчика ограничена: если клиент не успевает читать, накопленные события
+    # заменяются одним событием resync с текущими остатками
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(max(queue_size, 1))
+        self.dropped = 0
+
+    def offer(self, event: dict, totals: dict) -> None:
+        if self.queue.full():
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"event": "resync", **totals})
+            return
+        self.queue.put_nowait(event)
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InventoryFeed:
+    # события записи в rolls рассылаются всем подписчикам WebSocket/SSE текущего процесса
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: set[FeedSubscriber] = set()
+        self.on_hand: Optional[tuple[int, float]] = None
+        self.published = 0
+        self.dropped = 0
+
+    def totals(self) -> dict:
+        count, weight = self.on_hand or (0, 0.0)
+        return {"on_hand_count": count, "on_hand_weight": weight}
+
+    async def load_totals(self) -> dict:
+        if self.on_hand is None:
+            async with async_session() as session:
+                self.on_hand = await DailyRollup.totals(session)
+        return self.totals()
+
+    def subscribe(self) -> FeedSubscriber:
+        subscriber = FeedSubscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: FeedSubscriber) -> None:
+        self.subscribers.discard(subscriber)
+        self.dropped += subscriber.dropped
+
+    def publish(self, event: str, on_hand: tuple[int, float], **data) -> None:
+        self.on_hand = on_hand
+        if not self.subscribers:
+            return
+        totals = self.totals()
+        message = {"event": event, **data, **totals}
+        for subscriber in self.subscribers:
+            subscriber.offer(message, totals)
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self.subscribers), "published": self.published,
+                "dropped": self.dropped + sum(subscriber.dropped for subscriber in self.subscribers),
+                "queue_size": self.queue_size}
+
+
+def encode_event(message: dict) -> bytes:
+    return b"event: " + message["event"].encode() + b"\ndata: " + orjson.dumps(message) + b"\n\n"
+
+
+inventory_feed = InventoryFeed(settings.feed_queue_size)
@@ -0,0 +1,80 @@
+import csv
+from typing import AsyncIterator, Union
+
+import orjson
+
+FIELDS = ("length", "weight", "added_date", "removed_date")
+BULK_BATCH_SIZE = 5000
+
+
+class BodyFormatError(ValueError):
+    # тело запроса целиком не подходит по формату, записи из него не читались
+    pass
+
+
+async def read_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    tail = b""
+    async for chunk in stream:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+
+async def read_ndjson(stream: AsyncIterator[bytes]) -> AsyncIterator[Union[dict, str]]:
+    async for line in read_lines(stream):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            yield "строка не является JSON"
+        else:
+            yield record if isinstance(record, dict) else "строка не является объектом JSON"
+
+
+async def read_csv(stream: AsyncIterator[bytes]) -> AsyncIterator[Union[dict, str]]:
+    fields = FIELDS
+    first = True
+    async for line in read_lines(stream):
+        try:
+            line = line.decode("utf-8-sig").strip()
+        except UnicodeDecodeError:
+            yield "строка не в кодировке UTF-8"
+            continue
+        if not line:
+            continue
+        cells = [cell.strip() for cell in next(csv.reader([line]))]
+        if first:
+            first = False
+            if set(cells) <= set(FIELDS):
+                fields = tuple(cells)
+                continue
+        if len(cells) > len(fields):
+            yield f"ожидается не больше {len(fields)} колонок"
+            continue
+        yield {field: cell for field, cell in zip(fields, cells) if cell != ""}
+
+
+async def read_json_array(stream: AsyncIterator[bytes]) -> AsyncIterator[Union[dict, str]]:
+    body = b"".join([chunk async for chunk in stream])
+    try:
+        records = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        records = None
+    if not isinstance(records, list):
+        raise BodyFormatError("тело запроса должно быть массивом JSON")
+    for record in records:
+        yield record if isinstance(record, dict) else "элемент массива не является объектом JSON"
+
+
+def read_records(content_type: str, stream: AsyncIterator[bytes]) -> AsyncIterator[Union[dict, str]]:
+    # каждая запись - словарь полей рулона либо текст ошибки разбора этой строки
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonlines"):
+        return read_ndjson(stream)
+    if content_type in ("text/csv", "application/csv"):
+        return read_csv(stream)
+    return read_json_array(stream)
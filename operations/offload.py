@@ -0,0 +1,118 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError
+
+from config import settings
+from rollup import DailyRollup
+from schemas import RollStatistic, parse_date
+from timeline import InventoryTimeline
+
+PROGRESS_STEPS = 10000  # как часто SQLite проверяет срок выполнения запроса (в инструкциях VM)
+
+_engines: dict[str, Engine] = {}
+
+
+def read_only_url(database_url: str) -> Optional[str]:
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return f"sqlite:///file:{os.path.abspath(url.database)}?mode=ro&uri=true"
+
+
+def _engine(url: str) -> Engine:
+    # у каждого процесса пула свой движок и свои соединения только для чтения
+    engine = _engines.get(url)
+    if engine is None:
+        engine = _engines[url] = create_engine(url)
+    return engine
+
+
+def _run_query_job(url: str, timeout: float, job: Callable):
+    with _engine(url).connect() as connection:
+        sqlite_connection = connection.connection.driver_connection
+        if timeout > 0:
+            # SQLite прерывает запрос, если обработчик вернул True
+            deadline = time.monotonic() + timeout
+            sqlite_connection.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+        try:
+            return job(connection)
+        finally:
+            sqlite_connection.set_progress_handler(None, 0)
+
+
+def statistic_job(url: str, timeout: float, start_date: str, end_date: str) -> RollStatistic:
+    def job(connection):
+        return RollStatistic(**connection.execute(DailyRollup.query(start_date, end_date)).mappings().one())
+    return _run_query_job(url, timeout, job)
+
+
+def timeline_job(url: str, timeout: float, start_date: str, end_date: str) -> InventoryTimeline:
+    start, end = parse_date(start_date), parse_date(end_date)
+
+    def job(connection):
+        before = connection.execute(DailyRollup.on_hand_before_query(start)).first()
+        rows = connection.execute(DailyRollup.timeline_query(start, end)).all()
+        return DailyRollup.carry_forward(start, end, before, rows)
+    return _run_query_job(url, timeout, job)
+
+
+class StatisticPool:
+    # тяжелая статистика считается вне цикла событий: в пуле потоков или процессов
+    executor: Optional[Executor] = None
+    url: Optional[str] = None
+    completed = 0
+    timeouts = 0
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.executor is not None
+
+    @classmethod
+    def start(cls) -> bool:
+        cls.url = read_only_url(settings.database_url)
+        if settings.statistic_pool == "off" or cls.url is None:
+            return False
+        workers = max(settings.statistic_pool_size, 1)
+        if settings.statistic_pool == "process":
+            # fork процесса с работающим циклом событий небезопасен, поэтому процессы запускаются через spawn
+            cls.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            cls.executor = ThreadPoolExecutor(workers, thread_name_prefix="statistic")
+        return True
+
+    @classmethod
+    def stop(cls) -> None:
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=False, cancel_futures=True)
+            cls.executor = None
+
+    @classmethod
+    async def run(cls, job: Callable, *args):
+        # по истечении таймаута ожидание отменяется, а запрос в воркере прерывает progress handler SQLite
+        timeout = settings.statistic_timeout
+        future = asyncio.get_running_loop().run_in_executor(cls.executor, job, cls.url, timeout, *args)
+        try:
+            result = await asyncio.wait_for(future, timeout if timeout > 0 else None)
+        except asyncio.TimeoutError:
+            cls.timeouts += 1
+            raise
+        except OperationalError as error:
+            # запрос прерван в воркере раньше, чем истекло ожидание
+            if "interrupted" not in str(error):
+                raise
+            cls.timeouts += 1
+            raise asyncio.TimeoutError from error
+        cls.completed += 1
+        return result
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {"mode": settings.statistic_pool if cls.enabled() else "off", "size": settings.statistic_pool_size,
+                "timeout": settings.statistic_timeout, "completed": cls.completed, "timeouts": cls.timeouts}
@@ -1,12 +1,26 @@
+import asyncio
 import re
-from typing import Annotated
-
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
-
-from database import delete_tables, create_tables
-from factory import RollFactory
-from schemas import RollAdd, Roll
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+
+from coherence import ChangeLog
+from database import delete_tables, create_tables, write_session, writer_lock, DatabaseHealth
+from analytics import analytics_snapshot
+from archive import RollArchive
+from cache import statistic_cache
+from config import settings
+from factory import RollFactory, SORT_KEYS
+from feed import inventory_feed, encode_event
+from ingest import read_records, BodyFormatError, BULK_BATCH_SIZE
+from schemas import RollAdd, Roll, RollsRemove, RollSearch, parse_date, MAX_ROLL_ID
+from series import StatisticSeries, BUCKETS, SERIES_METRICS
+from write_queue import roll_write_queue
+
+MAX_REMOVE_ROLLS = 30000  # не больше лимита параметров запроса SQLite
+RollId = Annotated[int, Query(ge=1, le=MAX_ROLL_ID)]
 
 router = APIRouter(
     prefix="/rolls",
@@ -17,6 +31,10 @@ router = APIRouter(
 def check_string(s: str) -> bool:
     pattern = re.compile(r'\d{2}.\d{2}.\d{4}')
     if pattern.match(s):
+        try:
+            parse_date(s)
+        except ValueError:
+            return False
         return True
     else:
         return False
@@ -26,7 +44,7 @@ def check_string(s: str) -> bool:
 async def add_roll(roll: Annotated[RollAdd, Depends()]) -> JSONResponse:
     if RollFactory.check_connection():
         if check_string(roll.added_date) and (roll.removed_date is None or check_string(roll.removed_date)):
-            roll_id = await RollFactory.add_one_roll(roll)
+            roll_id = await roll_write_queue.submit(roll)
             if roll_id >= 0:
                 return JSONResponse(status_code=200, content={"message": f"рулон {roll_id} успешно добавлен"})
             else:
@@ -38,67 +56,212 @@ async def add_roll(roll: Annotated[RollAdd, Depends()]) -> JSONResponse:
         return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
 
 
+def validate_roll(record: dict) -> RollAdd:
+    roll = RollAdd(**record)
+    if not check_string(roll.added_date) or (roll.removed_date is not None and not check_string(roll.removed_date)):
+        raise ValueError("added_date или removed_date не соотвествует формату даты (дд.мм.гггг)")
+    return roll
+
+
+@router.post("/add_rolls")
+async def add_rolls(request: Request) -> JSONResponse:
+    if RollFactory.check_connection():
+        records = read_records(request.headers.get("content-type", ""), request.stream())
+        inserted, errors, batch = 0, [], []
+        row_number = 0
+        try:
+            async for record in records:
+                row_number += 1
+                if isinstance(record, str):
+                    errors.append({"row": row_number, "message": record})
+                    continue
+                try:
+                    roll = validate_roll(record)
+                except ValidationError as e:
+                    errors.append({"row": row_number, "message": "; ".join(
+                        f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())})
+                    continue
+                except ValueError as e:
+                    errors.append({"row": row_number, "message": str(e)})
+                    continue
+                batch.append((row_number, roll.orm_values()))
+                if len(batch) >= BULK_BATCH_SIZE:
+                    batch_inserted, batch_errors = await RollFactory.add_rolls(batch)
+                    inserted += batch_inserted
+                    errors.extend(batch_errors)
+                    batch = []
+        except BodyFormatError as e:
+            return JSONResponse(status_code=400, content={"message": str(e)})
+        if batch:
+            batch_inserted, batch_errors = await RollFactory.add_rolls(batch)
+            inserted += batch_inserted
+            errors.extend(batch_errors)
+        errors.sort(key=lambda error: error["row"])
+        return JSONResponse(status_code=200, content={"message": f"рулонов добавлено: {inserted}",
+                                                      "inserted": inserted, "errors": errors})
+    else:
+        return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
+
+
 @router.get("/get_rolls")
-async def get_rolls(sorting_properties: str = '') -> list[Roll]:
+async def get_rolls(response: Response, sorting_properties: str = 'id',
+                    after_id: Annotated[Optional[int], Query(ge=0, le=MAX_ROLL_ID)] = None,
+                    after_date: Optional[str] = None, limit: Annotated[int, Query(ge=1, le=10000)] = 1000,
+                    stream: bool = False) -> list[Roll]:
     if RollFactory.check_connection():
-        rolls = await RollFactory.find_all(sorting_properties)
+        if sorting_properties == '':
+            sorting_properties = 'id'
+        if sorting_properties not in SORT_KEYS:
+            return JSONResponse(status_code=400, content={"message": f"сортировка возможна только по полям: "
+                                                                     f"{', '.join(SORT_KEYS)}"})
+        if sorting_properties == 'added_date' and after_id is not None:
+            # при сортировке по дате курсор состоит из двух значений: X-Next-After-Date и X-Next-After-Id
+            if after_date is None:
+                return JSONResponse(status_code=400, content={"message": "при сортировке по added_date вместе с "
+                                                                         "after_id нужно передать after_date"})
+            if not check_string(after_date):
+                return JSONResponse(status_code=400, content={"message": "after_date не соотвествует формату даты "
+                                                                         "(дд.мм.гггг)"})
+        if stream:
+            return StreamingResponse(RollFactory.stream_rolls(sorting_properties, after_id, after_date),
+                                     media_type="application/x-ndjson")
+        rolls = await RollFactory.find_page(sorting_properties, after_id, limit, after_date)
+        if len(rolls) == limit:
+            response.headers["X-Next-After-Id"] = str(rolls[-1]["id"])
+            if sorting_properties == 'added_date':
+                response.headers["X-Next-After-Date"] = rolls[-1]["added_date"]
         return rolls
     else:
         return []
 
 
+@router.post("/search")
+async def search_rolls(search: RollSearch, response: Response):
+    if RollFactory.check_connection():
+        if search.on_hand and search.removed:
+            return JSONResponse(status_code=400, content={"message": "on_hand и removed не могут быть заданы вместе"})
+        if search.ids is not None and len(search.ids) > MAX_REMOVE_ROLLS:
+            return JSONResponse(status_code=400, content={"message": f"не больше {MAX_REMOVE_ROLLS} id за запрос"})
+        for name, value in search.dates().items():
+            if value is not None and not check_string(value):
+                return JSONResponse(status_code=400, content={"message": f"{name} не соотвествует формату даты "
+                                                                         f"(дд.мм.гггг)"})
+        rolls = await RollFactory.search_rolls(search)
+        if len(rolls) == search.limit:
+            response.headers["X-Next-After-Id"] = str(rolls[-1]["id"])
+        return rolls
+    else:
+        return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
+
+
+STATISTIC_PARAMETERS = ("count_added", "count_removed", "mean_length_weight", "min_max_length_weight",
+                        "sum_length_weight", "min_max_datadiff", "min_max_inventory_days", "min_max_wight_days",
+                        "length_quantiles", "weight_quantiles", "duration_quantiles",
+                        "length_histogram", "weight_histogram", "duration_histogram")
+COLUMN_NAMES = {"length": "длины", "weight": "веса", "duration": "промежутка хранения"}
+
+
+def statistic_timeout_message() -> str:
+    return f"статистика не посчитана за {settings.statistic_timeout} с, уменьшите период"
+
+
+async def statistic_content(parameter: str, start_date: str, end_date: str) -> dict:
+    if parameter == "count_added":
+        count = await RollFactory.count_added(start_date, end_date)
+        return {"message": f"рулонов добавлено: {count}."}
+
+    elif parameter == "count_removed":
+        count = await RollFactory.count_removed(start_date, end_date)
+        return {"message": f"рулонов удалено: {count}."}
+
+    elif parameter == "mean_length_weight":
+        length, weight = await RollFactory.mean_length_weight(start_date, end_date)
+        return {"message": f"средняя длина: {length}; "
+                           f" средний вес: {weight}."}
+
+    elif parameter == "min_max_length_weight":
+        min_length, max_length, min_weight, max_weight = await RollFactory.min_max_length_weight(start_date,
+                                                                                                 end_date)
+        return {"message": f"длина: {min_length} - {max_length}; "
+                           f"вес: {min_weight} - {max_weight}."}
+
+    elif parameter == "sum_length_weight":
+        length, weight = await RollFactory.sum_length_weight(start_date, end_date)
+        return {"message": f"суммарная длина: {length}; "
+                           f"суммарный вес: {weight}."}
+
+    elif parameter == "min_max_datadiff":
+        min_duration_days, max_duration_days = await RollFactory.min_max_datadiff(start_date, end_date)
+        return {"message": f"минимальный промежуток хранения: {min_duration_days}; "
+                           f"максимальный промежуток хранения: {max_duration_days}."}
+
+    elif parameter == "min_max_inventory_days":
+        min_date, max_date = await RollFactory.min_max_inventory_days(start_date, end_date)
+        return {"message": f"День минимальной загрузки склада по количеству: {min_date}; "
+                           f"день максимальной загрузки "
+                           f"склада по количеству: {max_date}."}
+
+    elif parameter == "min_max_wight_days":
+        min_date, max_date = await RollFactory.min_max_wight_days(start_date, end_date)
+        return {"message": f"День минимальной загрузки склада по весу: {min_date}; "
+                           f"день максимальной загрузки склада по весу: {max_date}."}
+
+    elif parameter.endswith("_quantiles"):
+        column = parameter.removesuffix("_quantiles")
+        quantiles = await RollFactory.quantiles(column, start_date, end_date)
+        values = "; ".join(f"{float(q) * 100:g}%: {value}" for q, value in quantiles.items())
+        return {"message": f"квантили {COLUMN_NAMES[column]}: {values or 'нет данных'}.", "quantiles": quantiles}
+
+    elif parameter.endswith("_histogram"):
+        column = parameter.removesuffix("_histogram")
+        histogram = await RollFactory.histogram(column, start_date, end_date)
+        edges, counts = histogram["edges"], histogram["counts"]
+        values = "; ".join(f"{edges[i]} - {edges[i + 1]}: {count}" for i, count in enumerate(counts))
+        return {"message": f"гистограмма {COLUMN_NAMES[column]}: {values or 'нет данных'}.", "histogram": histogram}
+
+
+async def all_statistic_content(start_date: str, end_date: str) -> dict:
+    statistic = await RollFactory.get_statistic(start_date, end_date)
+    timeline = await RollFactory.inventory_timeline(start_date, end_date)
+    min_inventory_day, max_inventory_day = timeline.min_max_count_days()
+    min_wight_day, max_wight_day = timeline.min_max_weight_days()
+
+    return {"message": f"рулонов добавлено: {statistic.count_added}; рулонов "
+                       f"удалено: {statistic.count_removed}; средняя "
+                       f"длина: {statistic.mean_length}; "
+                       f"средний вес: {statistic.mean_weight}; "
+                       f"длина: {statistic.min_length} - {statistic.max_length}; "
+                       f"вес: {statistic.min_weight} - {statistic.max_weight}; "
+                       f"суммарная длина: {statistic.sum_length}; "
+                       f"суммарный вес: {statistic.sum_weight}; "
+                       f"минимальный промежуток хранения: {statistic.min_duration_days}; "
+                       f"максимальный промежуток хранения: {statistic.max_duration_days}; "
+                       f"День минимальной загрузки склада по "
+                       f"количеству: {min_inventory_day}; "
+                       f"день максимальной загрузки склада по "
+                       f"количеству: {max_inventory_day}; "
+                       f"День минимальной загрузки склада по весу: {min_wight_day}; "
+                       f"день максимальной загрузки склада по весу: {max_wight_day}."}
+
+
 @router.get("/get_statistic")
 async def get_statistic(parameter: str, start_date: str, end_date: str) -> JSONResponse:
     if RollFactory.check_connection():
         if check_string(start_date) and check_string(end_date):
-            if parameter == "count_added":
-                count = await RollFactory.count_added(start_date, end_date)
-                return JSONResponse(status_code=200, content={"message": f"рулонов добавлено: {count}."})
-
-            elif parameter == "count_removed":
-                count = await RollFactory.count_removed(start_date, end_date)
-                return JSONResponse(status_code=200, content={"message": f"рулонов удалено: {count}."})
-
-            elif parameter == "mean_length_weight":
-                length, weight = await RollFactory.mean_length_weight(start_date, end_date)
-                return JSONResponse(status_code=200, content={"message": f"средняя длина: {length}; "
-                                                                         f" средний вес: {weight}."})
-
-            elif parameter == "min_max_length_weight":
-                min_length, max_length, min_weight, max_weight = await RollFactory.min_max_length_weight(start_date,
-                                                                                                         end_date)
-                return JSONResponse(status_code=200, content={"message": f"длина: {min_length} - {max_length}; "
-                                                                         f"вес: {min_weight} - {max_weight}."})
-
-            elif parameter == "sum_length_weight":
-                length, weight = await RollFactory.sum_length_weight(start_date, end_date)
-                return JSONResponse(status_code=200, content={"message": f"суммарная длина: {length}; "
-                                                                         f"суммарный вес: {weight}."})
-
-            elif parameter == "min_max_datadiff":
-                min_duration_days, max_duration_days = await RollFactory.min_max_datadiff(start_date, end_date)
-                return JSONResponse(status_code=200, content={
-                    "message": f"минимальный промежуток хранения: {min_duration_days}; "
-                               f"максимальный промежуток хранения: {max_duration_days}."})
-
-            elif parameter == "min_max_inventory_days":
-                min_date, max_date = await RollFactory.min_max_inventory_days(start_date, end_date)
-                return JSONResponse(status_code=200,
-                                    content={"message": f"День минимальной загрузки склада по количеству: {min_date}; "
-                                                        f"день максимальной загрузки "
-                                                        f"склада по количеству: {max_date}."})
-
-            elif parameter == "min_max_wight_days":
-                min_date, max_date = await RollFactory.min_max_wight_days(start_date, end_date)
-                return JSONResponse(status_code=200,
-                                    content={"message": f"День минимальной загрузки склада по весу: {min_date}; "
-                                                        f"день максимальной загрузки склада по весу: {max_date}."})
-
-            else:
+            if parameter not in STATISTIC_PARAMETERS:
                 return JSONResponse(status_code=404, content={"message": f"Команда {parameter} не существует"})
+            await ChangeLog.sync()
+            try:
+                content = await statistic_cache.get_or_compute(
+                    (parameter, parse_date(start_date), parse_date(end_date)),
+                    lambda: statistic_content(parameter, start_date, end_date)
+                )
+            except asyncio.TimeoutError:
+                return JSONResponse(status_code=504, content={"message": statistic_timeout_message()})
+            return JSONResponse(status_code=200, content=content)
 
         else:
-            JSONResponse(status_code=400, content={"message": f"start_date или end_date не соотвествует формату даты "
+            return JSONResponse(status_code=400, content={"message": f"start_date или end_date не соотвествует формату даты "
                                                               f"(дд.мм.гггг)"})
 
     else:
@@ -109,34 +272,15 @@ async def get_statistic(parameter: str, start_date: str, end_date: str) -> JSONR
 async def get_all_statistic(start_date: str, end_date: str) -> JSONResponse:
     if RollFactory.check_connection():
         if check_string(start_date) and check_string(end_date):
-            count_added = await RollFactory.count_added(start_date, end_date)
-            count_removed = await RollFactory.count_removed(start_date, end_date)
-            mean_length, mean_weight = await RollFactory.mean_length_weight(start_date, end_date)
-            min_length, max_length, min_weight, max_weight = await RollFactory.min_max_length_weight(start_date,
-                                                                                                     end_date)
-            sum_length, sum_weight = await RollFactory.sum_length_weight(start_date, end_date)
-            min_duration_days, max_duration_days = await RollFactory.min_max_datadiff(start_date, end_date)
-            min_inventory_day, max_inventory_day = await RollFactory.min_max_inventory_days(start_date, end_date)
-            min_wight_day, max_wight_day = await RollFactory.min_max_wight_days(start_date, end_date)
-
-            return JSONResponse(status_code=200,
-                                content={"message": f"рулонов добавлено: {count_added}; рулонов "
-                                                    f"удалено: {count_removed}; средняя "
-                                                    f"длина: {mean_length}; "
-                                                    f"средний вес: {mean_weight}; "
-                                                    f"длина: {min_length} - {max_length}; "
-                                                    f"вес: {min_weight} - {max_weight}; "
-                                                    f"суммарная длина: {sum_length}; "
-                                                    f"суммарный вес: {sum_weight}; "
-                                                    f"минимальный промежуток хранения: {min_duration_days}; "
-                                                    f"максимальный промежуток хранения: {max_duration_days}; "
-                                                    f"День минимальной загрузки склада по "
-                                                    f"количеству: {min_inventory_day}; "
-                                                    f"день максимальной загрузки склада по "
-                                                    f"количеству: {max_inventory_day}; "
-                                                    f"День минимальной загрузки склада по весу: {min_wight_day}; "
-                                                    f"день максимальной загрузки склада по весу: {max_wight_day}."
-                                         })
+            await ChangeLog.sync()
+            try:
+                content = await statistic_cache.get_or_compute(
+                    ("all", parse_date(start_date), parse_date(end_date)),
+                    lambda: all_statistic_content(start_date, end_date)
+                )
+            except asyncio.TimeoutError:
+                return JSONResponse(status_code=504, content={"message": statistic_timeout_message()})
+            return JSONResponse(status_code=200, content=content)
         else:
             return JSONResponse(status_code=400,
                                 content={"message": f"start_date или end_date не соотвествует формату даты "
@@ -145,16 +289,120 @@ async def get_all_statistic(start_date: str, end_date: str) -> JSONResponse:
         return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
 
 
+@router.get("/get_statistic_series")
+async def get_statistic_series(start_date: str, end_date: str, bucket: str = "day",
+                               metrics: str = ",".join(SERIES_METRICS)) -> JSONResponse:
+    if RollFactory.check_connection():
+        if not (check_string(start_date) and check_string(end_date)):
+            return JSONResponse(status_code=400,
+                                content={"message": f"start_date или end_date не соотвествует формату даты "
+                                                    f"(дд.мм.гггг)"})
+        if bucket not in BUCKETS:
+            return JSONResponse(status_code=400, content={"message": f"bucket должен быть одним из: "
+                                                                     f"{', '.join(BUCKETS)}"})
+        metric_list = [metric.strip() for metric in metrics.split(",") if metric.strip()]
+        unknown = [metric for metric in metric_list if metric not in SERIES_METRICS]
+        if unknown or not metric_list:
+            return JSONResponse(status_code=400, content={"message": f"неизвестные показатели: {', '.join(unknown)}; "
+                                                                     f"доступны: {', '.join(SERIES_METRICS)}"})
+        await ChangeLog.sync()
+        series = await statistic_cache.get_or_compute(
+            ("series", bucket, tuple(metric_list), parse_date(start_date), parse_date(end_date)),
+            lambda: StatisticSeries.build(bucket, metric_list, start_date, end_date)
+        )
+        return JSONResponse(status_code=200, content={"start_date": start_date, "end_date": end_date,
+                                                      "bucket": bucket, "metrics": metric_list, "series": series})
+    else:
+        return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
+
+
+@router.get("/statistic_cache")
+async def get_statistic_cache() -> JSONResponse:
+    return JSONResponse(status_code=200, content=statistic_cache.stats())
+
+
+@router.get("/analytics_snapshot")
+async def get_analytics_snapshot(refresh: bool = False) -> JSONResponse:
+    if refresh:
+        if not RollFactory.check_connection():
+            return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
+        await ChangeLog.sync()
+        await analytics_snapshot.refresh()
+    return JSONResponse(status_code=200, content=analytics_snapshot.footprint())
+
+
+@router.post("/archive")
+async def archive_rolls(before: str) -> JSONResponse:
+    if RollFactory.check_connection():
+        if not check_string(before):
+            return JSONResponse(status_code=400, content={"message": "before не соотвествует формату даты (дд.мм.гггг)"})
+        moved = await RollArchive.move(parse_date(before))
+        return JSONResponse(status_code=200, content={"message": f"Перенесено в архив рулонов: {moved}", "moved": moved})
+    else:
+        return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
+
+
+@router.get("/archive")
+async def get_archive_stats() -> JSONResponse:
+    if RollFactory.check_connection():
+        return JSONResponse(status_code=200, content=await RollArchive.stats())
+    else:
+        return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
+
+
+@router.get("/feed")
+async def get_feed(request: Request):
+    # Server-Sent Events: первое событие - текущие остатки, дальше события записи в rolls
+    if not RollFactory.check_connection():
+        return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
+    subscriber = inventory_feed.subscribe()
+    totals = await inventory_feed.load_totals()
+
+    async def events():
+        try:
+            yield encode_event({"event": "totals", **totals})
+            while not await request.is_disconnected():
+                message = await subscriber.next(settings.feed_heartbeat)
+                yield encode_event(message) if message is not None else b": ping\n\n"
+        finally:
+            inventory_feed.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/feed/ws")
+async def feed_websocket(websocket: WebSocket):
+    await websocket.accept()
+    subscriber = inventory_feed.subscribe()
+    try:
+        await websocket.send_json({"event": "totals", **await inventory_feed.load_totals()})
+        while True:
+            message = await subscriber.next(settings.feed_heartbeat)
+            await websocket.send_json(message if message is not None else {"event": "ping"})
+    except (WebSocketDisconnect, OSError):
+        # отключение клиента обнаруживается при отправке очередного события или ping
+        pass
+    finally:
+        inventory_feed.unsubscribe(subscriber)
+
+
+@router.get("/feed/stats")
+async def get_feed_stats() -> JSONResponse:
+    return JSONResponse(status_code=200, content=inventory_feed.stats())
+
+
 @router.get("/get_one_roll")
-def get_one_roll(roll_id: str) -> JSONResponse:
+async def get_one_roll(roll_id: RollId) -> JSONResponse:
     if RollFactory.check_connection():
-        response = RollFactory.get_roll_by_id(roll_id)
+        response = await RollFactory.get_roll_by_id(roll_id)
         if response["status"]:
             return JSONResponse(status_code=200,
-                                content={f"Информация о рулоне {roll_id}: длина- {response['status']}, "
-                                         f"вес- {response['status']}, "
-                                         f"дата добавления- {response['status']}, "
-                                         f"дата удаления- {response['status']}"})
+                                content={"message": f"Информация о рулоне {roll_id}: длина- {response['length']}, "
+                                                    f"вес- {response['weight']}, "
+                                                    f"дата добавления- {response['added_date']}, "
+                                                    f"дата удаления- {response['removed_date']}",
+                                         "roll": {key: response[key] for key in
+                                                  ("length", "weight", "added_date", "removed_date")}})
         else:
             return JSONResponse(status_code=404, content={"message": f"Рулон {roll_id} не найден"})
     else:
@@ -162,10 +410,10 @@ def get_one_roll(roll_id: str) -> JSONResponse:
 
 
 @router.delete("/remove_roll")
-def remove_roll(roll_id: str, removed_date: str) -> JSONResponse:
+async def remove_roll(roll_id: RollId, removed_date: str) -> JSONResponse:
     if RollFactory.check_connection():
         if check_string(removed_date):
-            response = RollFactory.delete_roll(roll_id, removed_date)
+            response = await RollFactory.delete_roll(roll_id, removed_date)
             if response:
                 return JSONResponse(status_code=200,
                                     content={"message": f"Запись об удалении рулона {roll_id} добавлена"})
@@ -178,10 +426,35 @@ def remove_roll(roll_id: str, removed_date: str) -> JSONResponse:
         return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
 
 
+@router.post("/remove_rolls")
+async def remove_rolls(request: RollsRemove) -> JSONResponse:
+    if RollFactory.check_connection():
+        if not check_string(request.removed_date):
+            return JSONResponse(status_code=400, content={"message": f"removed_date не соотвествует формату даты "
+                                                                     f"(дд.мм.гггг)"})
+        if request.ids is None and (request.start_id is None or request.end_id is None):
+            return JSONResponse(status_code=400, content={"message": "нужно указать ids или start_id и end_id"})
+        if request.ids is not None:
+            count = len(request.ids)
+        else:
+            count = request.end_id - request.start_id + 1
+        if not 0 < count <= MAX_REMOVE_ROLLS:
+            return JSONResponse(status_code=400, content={"message": f"за один запрос можно удалить "
+                                                                     f"от 1 до {MAX_REMOVE_ROLLS} рулонов"})
+        removed, not_found, already_removed = await RollFactory.remove_rolls(request.ids, request.start_id,
+                                                                             request.end_id, request.removed_date)
+        return JSONResponse(status_code=200, content={"message": f"Записи об удалении добавлены для "
+                                                                 f"{removed} рулонов",
+                                                      "removed": removed, "not_found": not_found,
+                                                      "already_removed": already_removed})
+    else:
+        return JSONResponse(status_code=404, content={"message": "база или таблица не найдены"})
+
+
 @router.delete("/remove_roll_info")
-def remove_roll_info(roll_id: str) -> JSONResponse:
+async def remove_roll_info(roll_id: RollId) -> JSONResponse:
     if RollFactory.check_connection():
-        response = RollFactory.delete_roll_info(roll_id)
+        response = await RollFactory.delete_roll_info(roll_id)
         if response:
             return JSONResponse(status_code=200, content={"message": f"Ифнормация о рулоне {roll_id} удалена"})
         else:
@@ -192,6 +465,14 @@ def remove_roll_info(roll_id: str) -> JSONResponse:
 
 @router.delete("/clear_db")
 async def clear_db():
-    await delete_tables()
-    await create_tables()
+    async with writer_lock():
+        await delete_tables()
+        await create_tables()
+    async with write_session() as session:
+        await ChangeLog.record(session, reset=True)
+        await session.commit()
+    statistic_cache.bump()
+    analytics_snapshot.invalidate_all()
+    inventory_feed.publish("cleared", (0, 0.0))
+    await DatabaseHealth.check()
     return JSONResponse(status_code=200, content={"message": f"База очищена"})
@@ -0,0 +1,176 @@
+import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from aggregates import RollAggregates
+from database import async_session, write_session, DailyInventoryOrm, RollOrm
+from schemas import RollStatistic, parse_date
+from timeline import InventoryTimeline
+
+DAY_FIELDS = ("added_count", "added_removed_count", "sum_length", "sum_weight", "min_length", "max_length",
+              "min_weight", "max_weight", "min_duration", "max_duration")
+REMOVED_FIELDS = ("removed_count", "removed_weight")
+EMPTY_DAY = {"added_count": 0, "added_removed_count": 0, "sum_length": 0, "sum_weight": 0, "min_length": None,
+             "max_length": None, "min_weight": None, "max_weight": None, "min_duration": None, "max_duration": None,
+             "removed_count": 0, "removed_weight": 0}
+
+
+class DailyRollup:
+    # таблица daily_inventory обновляется в той же транзакции, что и rolls;
+    # остаток на конец дня хранится в каждой строке, дни без строк наследуют остаток предыдущей строки
+
+    @classmethod
+    async def refresh_days(cls, session: AsyncSession, days: Iterable[Optional[datetime.date]]) -> None:
+        days = sorted({day for day in days if day is not None})
+        if not days:
+            return
+        await session.flush()
+        table = DailyInventoryOrm
+
+        result = await session.execute(
+            select(table.day, table.added_count, table.removed_count, table.sum_weight, table.removed_weight)
+            .filter(table.day.in_(days))
+        )
+        old = {row.day: row for row in result}
+
+        new = {day: dict(EMPTY_DAY, day=day) for day in days}
+        for row in await session.execute(RollAggregates.daily_query(days)):
+            new[row.day].update({field: getattr(row, field) for field in DAY_FIELDS})
+        for row in await session.execute(RollAggregates.daily_removed_query(days)):
+            new[row.day].update({field: getattr(row, field) for field in REMOVED_FIELDS})
+
+        for day in days:
+            if day not in old:
+                count, weight = await cls._on_hand_before(session, day)
+                await session.execute(insert(table).values(day=day, on_hand_count=count, on_hand_weight=weight))
+        await session.execute(update(table), list(new.values()))
+
+        # изменение прихода/расхода дня сдвигает остаток этого и всех последующих дней
+        for day in days:
+            values = new[day]
+            previous = old.get(day)
+            count_delta = values["added_count"] - values["removed_count"]
+            weight_delta = values["sum_weight"] - values["removed_weight"]
+            if previous is not None:
+                count_delta -= previous.added_count - previous.removed_count
+                weight_delta -= previous.sum_weight - previous.removed_weight
+            if count_delta or weight_delta:
+                await session.execute(
+                    update(table).filter(table.day >= day).values(
+                        on_hand_count=table.on_hand_count + count_delta,
+                        on_hand_weight=table.on_hand_weight + weight_delta,
+                    ).execution_options(synchronize_session=False)
+                )
+
+    @classmethod
+    def on_hand_before_query(cls, day: datetime.date):
+        table = DailyInventoryOrm
+        return (select(table.on_hand_count, table.on_hand_weight).filter(table.day < day)
+                .order_by(table.day.desc()).limit(1))
+
+    @classmethod
+    async def _on_hand_before(cls, session: AsyncSession, day: datetime.date) -> tuple[int, float]:
+        row = (await session.execute(cls.on_hand_before_query(day))).first()
+        return (row.on_hand_count, row.on_hand_weight) if row is not None else (0, 0.0)
+
+    @classmethod
+    async def totals(cls, session: AsyncSession) -> tuple[int, float]:
+        # остаток последнего дня сводки - текущий остаток склада
+        table = DailyInventoryOrm
+        row = (await session.execute(
+            select(table.on_hand_count, table.on_hand_weight).order_by(table.day.desc()).limit(1)
+        )).first()
+        return (row.on_hand_count, round(row.on_hand_weight, 6)) if row is not None else (0, 0.0)
+
+    @classmethod
+    async def rebuild(cls) -> int:
+        async with write_session() as session:
+            days = {}
+            for row in await session.execute(RollAggregates.daily_query()):
+                days[row.day] = dict(EMPTY_DAY, day=row.day, **{field: getattr(row, field) for field in DAY_FIELDS})
+            for row in await session.execute(RollAggregates.daily_removed_query()):
+                days.setdefault(row.day, dict(EMPTY_DAY, day=row.day))
+                days[row.day].update({field: getattr(row, field) for field in REMOVED_FIELDS})
+
+            count, weight = 0, 0.0
+            for day in sorted(days):
+                values = days[day]
+                count += values["added_count"] - values["removed_count"]
+                weight += values["sum_weight"] - values["removed_weight"]
+                values["on_hand_count"], values["on_hand_weight"] = count, weight
+
+            await session.execute(delete(DailyInventoryOrm))
+            if days:
+                await session.execute(insert(DailyInventoryOrm), [days[day] for day in sorted(days)])
+            await session.commit()
+        return len(days)
+
+    @classmethod
+    async def ensure(cls) -> bool:
+        # после обновления или миграции сводка может отсутствовать при непустой таблице rolls
+        async with async_session() as session:
+            has_rollup = (await session.execute(select(DailyInventoryOrm.day).limit(1))).first() is not None
+            has_rolls = (await session.execute(select(RollOrm.id).limit(1))).first() is not None
+        if has_rolls and not has_rollup:
+            await cls.rebuild()
+            return True
+        return False
+
+    @classmethod
+    def query(cls, start_date: str, end_date: str):
+        table = DailyInventoryOrm
+        added = func.sum(table.added_count)
+        return select(
+            func.coalesce(func.sum(table.added_count - table.added_removed_count), 0).label("count_added"),
+            func.coalesce(func.sum(table.added_removed_count), 0).label("count_removed"),
+            func.coalesce(func.sum(table.sum_length) / func.nullif(added, 0), 0).label("mean_length"),
+            func.coalesce(func.sum(table.sum_weight) / func.nullif(added, 0), 0).label("mean_weight"),
+            func.coalesce(func.min(table.min_length), 0).label("min_length"),
+            func.coalesce(func.max(table.max_length), 0).label("max_length"),
+            func.coalesce(func.min(table.min_weight), 0).label("min_weight"),
+            func.coalesce(func.max(table.max_weight), 0).label("max_weight"),
+            func.coalesce(func.sum(table.sum_length), 0).label("sum_length"),
+            func.coalesce(func.sum(table.sum_weight), 0).label("sum_weight"),
+            func.coalesce(func.min(table.min_duration), 0).label("min_duration_days"),
+            func.coalesce(func.max(table.max_duration), 0).label("max_duration_days"),
+        ).filter(
+            table.day.between(parse_date(start_date), parse_date(end_date))
+        )
+
+    @classmethod
+    async def collect(cls, start_date: str, end_date: str) -> RollStatistic:
+        async with async_session() as session:
+            result = await session.execute(cls.query(start_date, end_date))
+            row = result.mappings().one()
+        return RollStatistic(**row)
+
+    @classmethod
+    def timeline_query(cls, start: datetime.date, end: datetime.date):
+        table = DailyInventoryOrm
+        return (select(table.day, table.on_hand_count, table.on_hand_weight)
+                .filter(table.day.between(start, end)).order_by(table.day))
+
+    @classmethod
+    def carry_forward(cls, start: datetime.date, end: datetime.date, before, rows) -> InventoryTimeline:
+        count, weight = (before.on_hand_count, before.on_hand_weight) if before is not None else (0, 0.0)
+        rows = {row.day: row for row in rows}
+        counts, weights = [], []
+        day = start
+        while day <= end:
+            row = rows.get(day)
+            if row is not None:
+                count, weight = row.on_hand_count, row.on_hand_weight
+            counts.append(count)
+            weights.append(round(weight, 6))
+            day += datetime.timedelta(days=1)
+        return InventoryTimeline(start, counts, weights)
+
+    @classmethod
+    async def timeline(cls, start_date: str, end_date: str) -> InventoryTimeline:
+        start, end = parse_date(start_date), parse_date(end_date)
+        async with async_session() as session:
+            before = (await session.execute(cls.on_hand_before_query(start))).first()
+            rows = (await session.execute(cls.timeline_query(start, end))).all()
+        return cls.carry_forward(start, end, before, rows)
@@ -1,6 +1,19 @@
-from typing import Optional
+import datetime
+from typing import Annotated, Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+DATE_FORMAT = '%d.%m.%Y'
+MAX_ROLL_ID = 2 ** 63 - 1  # наибольшее значение INTEGER в SQLite; id больше него - ошибка 422, а не 500
+RollIdField = Annotated[int, Field(ge=1, le=MAX_ROLL_ID)]
+
+
+def parse_date(value: str) -> datetime.date:
+    return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
+
+def format_date(value: Optional[datetime.date]) -> Optional[str]:
+    return value.strftime(DATE_FORMAT) if value is not None else None
 
 
 class RollAdd(BaseModel):
@@ -9,6 +22,21 @@ class RollAdd(BaseModel):
     added_date: str
     removed_date: Optional[str] = None
 
+    @field_validator("added_date", "removed_date", mode="before")
+    @classmethod
+    def date_to_string(cls, value):
+        # в базе даты хранятся как DATE, наружу отдаются строкой дд.мм.гггг
+        if isinstance(value, datetime.date):
+            return format_date(value)
+        return value
+
+    def orm_values(self) -> dict:
+        values = self.model_dump()
+        values["added_date"] = parse_date(self.added_date)
+        if self.removed_date is not None:
+            values["removed_date"] = parse_date(self.removed_date)
+        return values
+
 
 class Roll(RollAdd):
     id: int
@@ -21,9 +49,44 @@ class RollId(BaseModel):
     roll_id: int
 
 
-class Dict_generator:  # объявленная переменная не видна в цикле, поэтому обновляется через класс
-    def __init__(self):
-        self.dictionary = {}
+class RollStatistic(BaseModel):
+    count_added: int = 0
+    count_removed: int = 0
+    mean_length: float = 0
+    mean_weight: float = 0
+    min_length: float = 0
+    max_length: float = 0
+    min_weight: float = 0
+    max_weight: float = 0
+    sum_length: float = 0
+    sum_weight: float = 0
+    min_duration_days: int = 0
+    max_duration_days: int = 0
+
+
+class RollsRemove(BaseModel):
+    removed_date: str
+    ids: Optional[list[RollIdField]] = None
+    start_id: Optional[RollIdField] = None
+    end_id: Optional[RollIdField] = None
+
+
+class RollSearch(BaseModel):
+    # все условия необязательные и объединяются через AND; даты - дд.мм.гггг, границы включаются
+    ids: Optional[list[RollIdField]] = None
+    min_length: Optional[float] = None
+    max_length: Optional[float] = None
+    min_weight: Optional[float] = None
+    max_weight: Optional[float] = None
+    added_from: Optional[str] = None
+    added_to: Optional[str] = None
+    removed_from: Optional[str] = None
+    removed_to: Optional[str] = None
+    on_hand: bool = False
+    removed: bool = False
+    after_id: Optional[Annotated[int, Field(ge=0, le=MAX_ROLL_ID)]] = None
+    limit: Annotated[int, Field(ge=1, le=10000)] = 1000
 
-    def add_el(self, key: int, el: str):
-        self.dictionary[key] = el
+    def dates(self) -> dict[str, Optional[str]]:
+        return {"added_from": self.added_from, "added_to": self.added_to,
+                "removed_from": self.removed_from, "removed_to": self.removed_to}
@@ -0,0 +1,102 @@
+import datetime
+
+from sqlalchemy import select, func, Date
+
+from database import async_session, DailyInventoryOrm
+from rollup import DailyRollup
+from schemas import parse_date, format_date
+
+BUCKETS = ("day", "week", "month")
+SERIES_METRICS = ("added_count", "removed_count", "sum_length", "sum_weight", "mean_length", "mean_weight",
+                  "min_length", "max_length", "min_weight", "max_weight", "min_duration_days", "max_duration_days",
+                  "on_hand_count", "on_hand_weight")
+ON_HAND_METRICS = ("on_hand_count", "on_hand_weight")
+
+
+def bucket_start(day: datetime.date, bucket: str) -> datetime.date:
+    if bucket == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: datetime.date, bucket: str) -> datetime.date:
+    if bucket == "week":
+        return start + datetime.timedelta(days=7)
+    if bucket == "month":
+        return (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+class StatisticSeries:
+    # ряд по дням/неделям (с понедельника)/месяцам: приход и расход считаются одним GROUP BY по daily_inventory,
+    # остаток на конец интервала берется из суточного ряда остатков
+
+    @classmethod
+    def query(cls, bucket: str, start: datetime.date, end: datetime.date):
+        table = DailyInventoryOrm
+        if bucket == "week":
+            key = func.date(table.day, '-6 days', 'weekday 1', type_=Date)
+        elif bucket == "month":
+            key = func.strftime('%Y-%m-01', table.day, type_=Date)
+        else:
+            key = table.day
+        return select(
+            key.label("bucket"),
+            func.sum(table.added_count).label("added_count"),
+            func.sum(table.removed_count).label("removed_count"),
+            func.sum(table.sum_length).label("sum_length"),
+            func.sum(table.sum_weight).label("sum_weight"),
+            func.min(table.min_length).label("min_length"),
+            func.max(table.max_length).label("max_length"),
+            func.min(table.min_weight).label("min_weight"),
+            func.max(table.max_weight).label("max_weight"),
+            func.min(table.min_duration).label("min_duration_days"),
+            func.max(table.max_duration).label("max_duration_days"),
+        ).filter(table.day.between(start, end)).group_by(key)
+
+    @classmethod
+    async def build(cls, bucket: str, metrics: list[str], start_date: str, end_date: str) -> list[dict]:
+        start, end = parse_date(start_date), parse_date(end_date)
+        async with async_session() as session:
+            result = await session.execute(cls.query(bucket, start, end))
+            rows = {row.bucket: row._asdict() for row in result}
+
+        on_hand = None
+        if any(metric in ON_HAND_METRICS for metric in metrics):
+            timeline = await DailyRollup.timeline(start_date, end_date)
+            on_hand = (start.toordinal(), timeline.counts, timeline.weights)
+
+        series = []
+        current = bucket_start(start, bucket)
+        while current <= end:
+            following = next_bucket(current, bucket)
+            bucket_end = min(following - datetime.timedelta(days=1), end)
+            values = cls._values(rows.get(current), on_hand, bucket_end)
+            point = {"start": format_date(max(current, start)), "end": format_date(bucket_end)}
+            point.update({metric: values[metric] for metric in metrics})
+            series.append(point)
+            current = following
+        return series
+
+    @classmethod
+    def _values(cls, row, on_hand, bucket_end: datetime.date) -> dict:
+        row = row or {}
+        added = row.get("added_count") or 0
+        values = {
+            "added_count": added,
+            "removed_count": row.get("removed_count") or 0,
+            "sum_length": row.get("sum_length") or 0,
+            "sum_weight": row.get("sum_weight") or 0,
+            "mean_length": (row.get("sum_length") or 0) / added if added else 0,
+            "mean_weight": (row.get("sum_weight") or 0) / added if added else 0,
+        }
+        for metric in ("min_length", "max_length", "min_weight", "max_weight", "min_duration_days",
+                       "max_duration_days"):
+            values[metric] = row.get(metric)
+        if on_hand is not None:
+            first_ordinal, counts, weights = on_hand
+            index = bucket_end.toordinal() - first_ordinal
+            values["on_hand_count"], values["on_hand_weight"] = counts[index], weights[index]
+        return values
@@ -0,0 +1,102 @@
+import datetime
+from typing import Optional
+
+from sqlalchemy import select, or_
+
+from aggregates import date_ordinal, all_rolls
+from database import async_session
+from schemas import parse_date, format_date
+
+
+class InventoryTimeline:
+    # остаток на складе на конец каждого дня диапазона: рулон числится на складе
+    # с дня добавления включительно до дня удаления (не включая его)
+
+    def __init__(self, start: datetime.date, counts: list[int], weights: list[float]):
+        self.start = start
+        self.counts = counts
+        self.weights = weights
+
+    @property
+    def days(self) -> list[datetime.date]:
+        return [self.start + datetime.timedelta(days=i) for i in range(len(self.counts))]
+
+    def items(self) -> list[tuple[datetime.date, int, float]]:
+        return list(zip(self.days, self.counts, self.weights))
+
+    def min_max_count_days(self) -> tuple[Optional[str], Optional[str]]:
+        return self._min_max_days(self.counts)
+
+    def min_max_weight_days(self) -> tuple[Optional[str], Optional[str]]:
+        return self._min_max_days(self.weights)
+
+    def _min_max_days(self, values: list) -> tuple[Optional[str], Optional[str]]:
+        # при равных значениях берется последний день, как раньше в Dict_generator
+        min_index = max_index = None
+        for i, value in enumerate(values):
+            if min_index is None or value <= values[min_index]:
+                min_index = i
+            if max_index is None or value >= values[max_index]:
+                max_index = i
+        if min_index is None:
+            return None, None
+        return self._format_day(min_index), self._format_day(max_index)
+
+    def _format_day(self, index: int) -> str:
+        return format_date(self.start + datetime.timedelta(days=index))
+
+    @classmethod
+    def sweep(cls, start: datetime.date, end: datetime.date, events) -> "InventoryTimeline":
+        # events: (added_ordinal, removed_ordinal | None, weight)
+        count_deltas, weight_deltas = cls._empty_deltas(start, end)
+        cls._apply_events(start, end, count_deltas, weight_deltas, events)
+        return cls._from_deltas(start, count_deltas, weight_deltas)
+
+    @classmethod
+    def _empty_deltas(cls, start: datetime.date, end: datetime.date) -> tuple[list[int], list[float]]:
+        days = max(end.toordinal() - start.toordinal() + 1, 0)
+        return [0] * (days + 1), [0.0] * (days + 1)
+
+    @classmethod
+    def _apply_events(cls, start: datetime.date, end: datetime.date, count_deltas: list[int],
+                      weight_deltas: list[float], events) -> None:
+        start_ordinal, end_ordinal = start.toordinal(), end.toordinal()
+        for added, removed, weight in events:
+            if added > end_ordinal or (removed is not None and removed <= start_ordinal):
+                continue
+            added_index = max(added - start_ordinal, 0)
+            count_deltas[added_index] += 1
+            weight_deltas[added_index] += weight
+            if removed is not None and removed <= end_ordinal:
+                count_deltas[removed - start_ordinal] -= 1
+                weight_deltas[removed - start_ordinal] -= weight
+
+    @classmethod
+    def _from_deltas(cls, start: datetime.date, count_deltas: list[int],
+                     weight_deltas: list[float]) -> "InventoryTimeline":
+        counts, weights = [], []
+        count, weight = 0, 0.0
+        for i in range(len(count_deltas) - 1):
+            count += count_deltas[i]
+            weight += weight_deltas[i]
+            counts.append(count)
+            # округление убирает накопленную ошибку сложения float
+            weights.append(round(weight, 6))
+        return cls(start, counts, weights)
+
+    @classmethod
+    async def build(cls, start_date: str, end_date: str) -> "InventoryTimeline":
+        start, end = parse_date(start_date), parse_date(end_date)
+        rolls = all_rolls()
+        query = select(
+            date_ordinal(rolls.c.added_date), date_ordinal(rolls.c.removed_date), rolls.c.weight
+        ).filter(
+            rolls.c.added_date <= end,
+            or_(rolls.c.removed_date.is_(None), rolls.c.removed_date > start)
+        )
+        count_deltas, weight_deltas = cls._empty_deltas(start, end)
+        async with async_session() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions(10000):
+                cls._apply_events(start, end, count_deltas, weight_deltas, partition)
+        return cls._from_deltas(start, count_deltas, weight_deltas)
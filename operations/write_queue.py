@@ -0,0 +1,82 @@
+import asyncio
+from typing import Optional
+
+from config import settings
+from factory import RollFactory
+from schemas import RollAdd
+
+
+class RollWriteQueue:
+    # групповая фиксация: рулоны, пришедшие за окно window_ms (не больше max_batch),
+    # записываются одной транзакцией, каждый вызывающий получает свой id или -1
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.rolls = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # None в очереди идет после всех принятых рулонов, поэтому они будут записаны до остановки
+        if self.running:
+            await self.queue.put(None)
+            await self.task
+        self.task = None
+
+    async def submit(self, roll: RollAdd) -> int:
+        if not self.running:
+            return await RollFactory.add_one_roll(roll)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((roll, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit(batch)
+
+    async def _commit(self, batch: list[tuple[RollAdd, asyncio.Future]]) -> None:
+        try:
+            roll_ids = await RollFactory.add_roll_batch([roll for roll, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.rolls += len(batch)
+        for (_, future), roll_id in zip(batch, roll_ids):
+            if not future.done():
+                future.set_result(roll_id)
+
+
+roll_write_queue = RollWriteQueue(settings.write_queue_window_ms, settings.write_queue_max_batch)
@@ -0,0 +1,53 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+import metrics
+from cache import statistic_cache
+from database import DatabaseHealth
+from offload import StatisticPool
+
+router = APIRouter(
+    prefix="",
+    tags=["Service"]
+)
+
+
+@router.get("/health")
+async def health(refresh: bool = False) -> JSONResponse:
+    if refresh:
+        await DatabaseHealth.check()
+    content = {
+        "status": "ok" if DatabaseHealth.available else "unavailable",
+        "database": DatabaseHealth.available,
+        "checked_at": DatabaseHealth.checked_at.isoformat() if DatabaseHealth.checked_at else None,
+    }
+    if DatabaseHealth.error is not None:
+        content["error"] = DatabaseHealth.error
+    return JSONResponse(status_code=200 if DatabaseHealth.available else 503, content=content)
+
+
+@router.get("/metrics")
+async def get_metrics() -> PlainTextResponse:
+    cache = statistic_cache.stats()
+    extra = [
+        "# HELP rolls_statistic_cache_events_total Statistic cache lookups by result",
+        "# TYPE rolls_statistic_cache_events_total counter",
+    ]
+    extra += [f'rolls_statistic_cache_events_total{{result="{name}"}} {cache[name]}'
+              for name in ("hits", "misses", "evictions", "coalesced")]
+    extra += [
+        "# HELP rolls_statistic_cache_entries Entries held by the statistic cache",
+        "# TYPE rolls_statistic_cache_entries gauge",
+        f"rolls_statistic_cache_entries {cache['size']}",
+        "# HELP rolls_database_available Result of the last database health check",
+        "# TYPE rolls_database_available gauge",
+        f"rolls_database_available {int(DatabaseHealth.available)}",
+    ]
+    pool = StatisticPool.stats()
+    extra += [
+        "# HELP rolls_statistic_pool_jobs_total Statistic jobs run in the worker pool by result",
+        "# TYPE rolls_statistic_pool_jobs_total counter",
+        f'rolls_statistic_pool_jobs_total{{result="completed"}} {pool["completed"]}',
+        f'rolls_statistic_pool_jobs_total{{result="timeout"}} {pool["timeouts"]}',
+    ]
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")